@@ -5,11 +5,28 @@ from app.seed_demo import main as seed_main
 if __name__ == "__main__":
     cmd = sys.argv[1:] if len(sys.argv) > 1 else []
     if not cmd:
-        print("Usage: python -m app seed")
+        print("Usage: python -m app seed|indexes [--check]|bench [sizes...]|stress [users] [rounds]|form-pods COURSE [--apply] [--profile NAME]|cdc [--backfill]")
         raise SystemExit(2)
 
     if cmd[0] == "seed":
         asyncio.run(seed_main())
+    elif cmd[0] == "indexes":
+        from app.indexes import main as indexes_main
+        raise SystemExit(asyncio.run(indexes_main(check_only="--check" in cmd[1:])))
+    elif cmd[0] == "bench":
+        from app.bench import run as bench_run
+        bench_run([int(x) for x in cmd[1:]] or None)
+    elif cmd[0] == "stress":
+        from app.stress import run as stress_run
+        raise SystemExit(asyncio.run(stress_run(*[int(x) for x in cmd[1:3]])))
+    elif cmd[0] == "form-pods" and len(cmd) > 1:
+        from app.matching import DEFAULT_PROFILE
+        from app.pod_optimizer import main as form_pods_main
+        profile = cmd[cmd.index("--profile") + 1] if "--profile" in cmd[:-1] else DEFAULT_PROFILE
+        raise SystemExit(asyncio.run(form_pods_main(cmd[1], apply="--apply" in cmd[2:], profile=profile)))
+    elif cmd[0] == "cdc":
+        from app.snowflake_cdc import main as cdc_main
+        raise SystemExit(asyncio.run(cdc_main(backfill="--backfill" in cmd[1:])))
     else:
         print(f"Unknown command: {cmd[0]}")
         raise SystemExit(2)
@@ -0,0 +1,99 @@
+"""
+Offline ranking benchmarks (no MongoDB server needed; config still
+requires MONGO_URI to be set, to any value).
+
+    python -m app bench [sizes...]
+
+Times one /recommendations worth of work — feature lookup, batch encoding,
+ranking and card assembly — on synthetic courses. Per-candidate cost should
+stay flat from 100 to 50,000 candidates; the legacy next()-scan join is timed
+alongside up to LEGACY_MAX to show the quadratic curve it replaced.
+"""
+from __future__ import annotations
+
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List
+
+from bson import ObjectId
+
+from .cards import candidate_card
+from .matching import ALL_ROLES, BLOCK_TO_RANGE, DAY_TO_IDX
+from .profile_cache import ProfileCache
+from .rank_engine import encode_profiles, rank_candidates_batch
+
+DEFAULT_SIZES = [100, 1_000, 5_000, 10_000, 50_000]
+LEGACY_MAX = 5_000
+
+SKILLS = [
+    "React", "TypeScript", "UI/UX", "FastAPI", "Python", "MongoDB", "APIs", "Docker",
+    "AWS", "Azure", "ML", "Data", "Security", "Testing", "SQL", "Go", "Java", "Figma",
+]
+SLOTS = [f"{d} {b}" for d in DAY_TO_IDX for b in BLOCK_TO_RANGE]
+
+
+def synthetic_users(n: int, course_code: str = "BENCH", seed: int = 0) -> List[Dict[str, Any]]:
+    """User documents shaped like the users collection, with presence merged in."""
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+    users = []
+    for _ in range(n):
+        users.append({
+            "_id": ObjectId(),
+            "displayName": f"Student{rng.randint(1000, 9999)}",
+            "courseCodes": [course_code],
+            "rolePrefs": rng.sample(ALL_ROLES, rng.randint(1, 2)),
+            "skills": rng.sample(SKILLS, rng.randint(2, 6)),
+            "availability": rng.sample(SLOTS, rng.randint(1, 6)),
+            "profileRev": 1,
+            "lastActiveAt": now - timedelta(hours=rng.uniform(0, 400)) if rng.random() < 0.8 else None,
+        })
+    return users
+
+
+def _time(fn: Callable[[], Any], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000.0
+
+
+def _recommend(cache: ProfileCache, me: Dict[str, Any], cand: List[Dict[str, Any]]) -> List[dict]:
+    batch = encode_profiles(
+        [cache.get("BENCH", u) for u in cand],
+        [u["lastActiveAt"] for u in cand],
+        cache.vocab("BENCH"),
+    )
+    ranked = rank_candidates_batch(cache.get("BENCH", me), batch, [])
+    return [candidate_card(cand[r["row"]], r) for r in ranked]
+
+
+def _legacy_join(cand: List[Dict[str, Any]], ranked: List[dict]) -> List[dict]:
+    out = []
+    for r in ranked:
+        u = next((x for x in cand if str(x["_id"]) == r["userId"]), None)
+        if u:
+            out.append(candidate_card(u, r))
+    return out
+
+
+def run(sizes: List[int] | None = None) -> None:
+    sizes = sizes or DEFAULT_SIZES
+    print(f"{'candidates':>10} {'total ms':>10} {'us/cand':>8} {'legacy join ms':>15}")
+    for n in sizes:
+        users = synthetic_users(n + 1, seed=n)
+        me, cand = users[0], users[1:]
+        cache = ProfileCache(max_entries=n + 1)
+        _recommend(cache, me, cand)  # warm the profile cache, as in steady state
+
+        ms = _time(lambda: _recommend(cache, me, cand))
+
+        legacy = "-"
+        if n <= LEGACY_MAX:
+            ranked = _recommend(cache, me, cand)
+            legacy = f"{_time(lambda: _legacy_join(cand, ranked), repeat=1):.1f}"
+
+        print(f"{n:>10} {ms:>10.1f} {1000.0 * ms / n:>8.1f} {legacy:>15}")
@@ -0,0 +1,20 @@
+"""Swipe cards for /recommendations (no database access; bench.py uses it too)."""
+from __future__ import annotations
+
+
+def candidate_card(u: dict, r: dict) -> dict:
+    """Swipe card for a candidate document and its ranking result."""
+    la = u.get("lastActiveAt")
+    if hasattr(la, "isoformat"):
+        la = la.isoformat()
+
+    return {
+        "userId": r["userId"],
+        "displayName": u.get("displayName", "Student"),
+        "rolePrefs": u.get("rolePrefs", []),
+        "skills": (u.get("skills") or [])[:6],
+        "availability": (u.get("availability") or [])[:3],
+        "lastActiveAt": la,
+        "score": float(r.get("score") or 0.0),
+        "reasons": [str(x) for x in (r.get("reasons") or [])],
+    }
@@ -19,5 +19,76 @@ SNOWFLAKE_PASSWORD = os.getenv("SNOWFLAKE_PASSWORD")
 SNOWFLAKE_WAREHOUSE = os.getenv("SNOWFLAKE_WAREHOUSE")
 SNOWFLAKE_DATABASE = os.getenv("SNOWFLAKE_DATABASE")
 SNOWFLAKE_SCHEMA = os.getenv("SNOWFLAKE_SCHEMA", "PUBLIC")
+# Dual-writes are batched per table into one MERGE per flush, every
+# SNOWFLAKE_FLUSH_INTERVAL_S or once a table has SNOWFLAKE_BATCH_MAX_ROWS rows
+SNOWFLAKE_FLUSH_INTERVAL_S = float(os.getenv("SNOWFLAKE_FLUSH_INTERVAL_S", "2"))
+SNOWFLAKE_BATCH_MAX_ROWS = int(os.getenv("SNOWFLAKE_BATCH_MAX_ROWS", "500"))
+# Outbox bound and what to do when it's full: "coalesce" (one row per key,
+# then drop oldest), "drop-oldest", or "block" (wait up to
+# SNOWFLAKE_OUTBOX_BLOCK_S for room, then drop the new row)
+SNOWFLAKE_OUTBOX_MAX = int(os.getenv("SNOWFLAKE_OUTBOX_MAX", "10000"))
+SNOWFLAKE_OUTBOX_POLICY = os.getenv("SNOWFLAKE_OUTBOX_POLICY", "coalesce").strip().lower()
+SNOWFLAKE_OUTBOX_BLOCK_S = float(os.getenv("SNOWFLAKE_OUTBOX_BLOCK_S", "1"))
+# Dedicated threads for Snowflake statements (one per table writes at a time)
+SNOWFLAKE_WORKERS = int(os.getenv("SNOWFLAKE_WORKERS", "3"))
+# Connection pool: at most SNOWFLAKE_POOL_SIZE connections, pinged only after
+# SNOWFLAKE_IDLE_CHECK_S idle; failed connects back off from
+# SNOWFLAKE_RETRY_MIN_S, doubling up to SNOWFLAKE_RETRY_MAX_S
+SNOWFLAKE_POOL_SIZE = int(os.getenv("SNOWFLAKE_POOL_SIZE", str(SNOWFLAKE_WORKERS)))
+SNOWFLAKE_IDLE_CHECK_S = float(os.getenv("SNOWFLAKE_IDLE_CHECK_S", "300"))
+SNOWFLAKE_RETRY_MIN_S = float(os.getenv("SNOWFLAKE_RETRY_MIN_S", "1"))
+SNOWFLAKE_RETRY_MAX_S = float(os.getenv("SNOWFLAKE_RETRY_MAX_S", "60"))
+# How long shutdown waits for the outbox to drain
+SNOWFLAKE_DRAIN_S = float(os.getenv("SNOWFLAKE_DRAIN_S", "10"))
+# Durable spool behind the outbox (SQLite WAL file; empty disables): rows are
+# synced to disk every SNOWFLAKE_SPOOL_SYNC_S, and compacted to the newest row
+# per key every SNOWFLAKE_SPOOL_COMPACT_S
+SNOWFLAKE_SPOOL_PATH = os.getenv("SNOWFLAKE_SPOOL_PATH", "snowflake_spool.db").strip()
+SNOWFLAKE_SPOOL_SYNC_S = float(os.getenv("SNOWFLAKE_SPOOL_SYNC_S", "0.2"))
+SNOWFLAKE_SPOOL_COMPACT_S = float(os.getenv("SNOWFLAKE_SPOOL_COMPACT_S", "60"))
+# Change data capture (python -m app cdc): changes are read in batches of up
+# to CDC_BATCH_MAX, or whatever arrived within CDC_BATCH_S
+CDC_BATCH_MAX = int(os.getenv("CDC_BATCH_MAX", "1000"))
+CDC_BATCH_S = float(os.getenv("CDC_BATCH_S", "1"))
+# In-memory stand-in for Snowflake (app/snowflake_fake.py), for offline testing
+SNOWFLAKE_FAKE = os.getenv("SNOWFLAKE_FAKE", "false").strip().lower() in ("1", "true", "yes", "y", "on")
 
+# Ranking caches
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "50000"))
+# Materialized feeds (per viewer and course); memory budget and max age,
+# which bounds staleness from writes handled by other workers
+FEED_MAX_MB = float(os.getenv("FEED_MAX_MB", "256"))
+FEED_MAX_AGE_S = float(os.getenv("FEED_MAX_AGE_S", "300"))
+# Ranking snapshots kept per feed for cursor paging of /recommendations
+FEED_SNAPSHOTS = int(os.getenv("FEED_SNAPSHOTS", "4"))
+# Rankings of at least this many candidates run sharded in a process pool of
+# RANK_POOL_WORKERS processes (0 keeps all ranking in-process); such courses
+# also encode and explain in a thread
+RANK_POOL_MIN_CANDIDATES = int(os.getenv("RANK_POOL_MIN_CANDIDATES", "10000"))
+RANK_POOL_WORKERS = int(os.getenv("RANK_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Extra weight profiles (ranking modes) as JSON, e.g.
+# {"balanced": {"role": 35, "skills": 25, "availability": 25, "activity": 15}}
+WEIGHT_PROFILES = os.getenv("WEIGHT_PROFILES", "")
+# How long a course's own "weightProfiles" are cached before re-reading
+WEIGHT_PROFILES_TTL_S = float(os.getenv("WEIGHT_PROFILES_TTL_S", "60"))
 
+# Admin endpoints (/admin/...) need X-Admin-Token to match; unset disables them
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Wall-clock budget for the whole-course pod optimizer's local search
+POD_OPTIMIZER_TIME_BUDGET_S = float(os.getenv("POD_OPTIMIZER_TIME_BUDGET_S", "5"))
+# ...which also stops once a pass improves the objective by less than this fraction
+POD_OPTIMIZER_MIN_GAIN = float(os.getenv("POD_OPTIMIZER_MIN_GAIN", "0.001"))
+
+# Presence write-behind buffer
+PRESENCE_FLUSH_INTERVAL_S = float(os.getenv("PRESENCE_FLUSH_INTERVAL_S", "5"))
+PRESENCE_FLUSH_MAX_PENDING = int(os.getenv("PRESENCE_FLUSH_MAX_PENDING", "5000"))
+# Resident presence index (courses kept in memory; optional change stream
+# keeps several workers in sync and needs a replica set)
+PRESENCE_INDEX_MAX_COURSES = int(os.getenv("PRESENCE_INDEX_MAX_COURSES", "200"))
+PRESENCE_CHANGE_STREAM = os.getenv("PRESENCE_CHANGE_STREAM", "false").strip().lower() in ("1", "true", "yes", "y", "on")
+# A failed change stream reopens after a backoff from MIN to MAX seconds
+PRESENCE_STREAM_RETRY_MIN_S = float(os.getenv("PRESENCE_STREAM_RETRY_MIN_S", "1"))
+PRESENCE_STREAM_RETRY_MAX_S = float(os.getenv("PRESENCE_STREAM_RETRY_MAX_S", "60"))
+# While no change stream is running, resident courses are reloaded this often
+# (0 disables), which bounds how stale other workers' heartbeats can be
+PRESENCE_REFRESH_S = float(os.getenv("PRESENCE_REFRESH_S", "30"))
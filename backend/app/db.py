@@ -73,3 +73,22 @@ async def check_connection():
 
 def col(name: str):
     return db[name]
+
+
+# Change stream error codes that reopening the stream as is won't fix
+HISTORY_LOST = (136, 280, 286)     # resume token no longer in the oplog
+NOT_REPLICA_SET = (40573,)
+
+
+# Per-use-case projections: reads transfer and decode only the fields they use,
+# so latency doesn't grow with goals/contact or future profile fields.
+REVISION_VIEW = {"profileRev": 1}
+RANKING_VIEW = {"rolePrefs": 1, "skills": 1, "availability": 1, "profileRev": 1}
+CARD_VIEW = {
+    "displayName": 1,
+    "rolePrefs": 1,
+    "skills": {"$slice": 6},
+    "availability": {"$slice": 3},
+}
+ROLES_VIEW = {"rolePrefs": 1}
+ID_VIEW = {"_id": 1}
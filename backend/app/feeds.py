@@ -0,0 +1,382 @@
+"""
+Materialized recommendation feeds.
+
+A feed is one viewer's scored course (rank_engine.ScoredBatch): the
+component matrix is computed once and serves every mode, and each read only
+weighs it, re-applies activity from the presence index and re-ranks (in
+rank_pool's processes for large courses). Feeds are built lazily by
+/recommendations on a miss and then kept current by targeted updates:
+
+- swipe:          marks one row removed in the swiper's feeds
+- profile change: queues that user's profile on every feed of the course,
+                  and drops the user's own feeds and those of their pod,
+                  whose role scores used it. A feed applies its queue in one
+                  batch when it's next read: re-scoring those rows and
+                  appending users who just joined
+- pod change:     drops the feeds of the pod's members
+
+Updates only reach this worker's store, so FEED_MAX_AGE_S bounds how long a
+feed can miss another worker's writes. The store is an LRU held under
+FEED_MAX_MB of estimated memory.
+
+Paging: a first page (limit, no cursor) is a top-K select, so only the
+page is ordered and explained. Cursors are opaque tokens carrying a
+snapshot id, the position and the last (score, userId) served. The first
+page has no snapshot, so the second ranks the feed once into one (kept on
+the feed, the newest FEED_SNAPSHOTS per feed), positioned just after that
+key; later pages slice it, skipping rows swiped since. When a snapshot is
+gone (feed rebuilt, another worker) the next page re-ranks and resumes
+after the key the same way.
+"""
+from __future__ import annotations
+
+import asyncio
+import base64
+import binascii
+import json
+import math
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .config import FEED_MAX_AGE_S, FEED_MAX_MB, FEED_SNAPSHOTS, RANK_POOL_MIN_CANDIDATES
+from .matching import ProfileFeatures
+from .rank_pool import rank_pool
+from .rank_engine import (
+    RankOrder,
+    ScoredBatch,
+    ScoringKernel,
+    encode_last_active,
+    explain_rows,
+    rescore_rows,
+    set_last_active,
+    update_batch,
+)
+
+FeedKey = Tuple[str, str]  # (courseCode, userId)
+
+
+@dataclass
+class Feed:
+    course_code: str
+    user_id: str
+    scored: ScoredBatch
+    row_of: Dict[str, int]
+    removed: np.ndarray                # bool per row: swiped
+    pod_members: Set[str]              # the viewer's pod (with the viewer), if any
+    built_at: float = field(default_factory=time.monotonic)
+    version: int = 0                   # bumped by every change to the feed
+    nbytes: int = 0
+    snapshots: "OrderedDict[str, RankOrder]" = field(default_factory=OrderedDict)
+    pending: Dict[str, ProfileFeatures] = field(default_factory=dict)  # profile changes not applied yet
+
+    def remaining(self) -> int:
+        return int(len(self.removed) - self.removed.sum())
+
+    async def rank(self, last_active: Dict[str, Any], kernel: ScoringKernel) -> List[Dict[str, Any]]:
+        """The whole feed, ranked and explained (in a thread for large courses)."""
+        ranking = await self._order(last_active, kernel)
+        if len(ranking.rows) >= RANK_POOL_MIN_CANDIDATES:
+            return await asyncio.to_thread(explain_rows, self.scored, ranking, ranking.rows)
+        return explain_rows(self.scored, ranking, ranking.rows)
+
+    async def top(
+        self, last_active: Dict[str, Any], kernel: ScoringKernel, limit: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """First page: the best `limit` rows, and the cursor state for the
+        next page (None at the end). Nothing past the page is ordered, so
+        the state has no snapshot; the next page resumes after its key."""
+        ranking = await self._order(last_active, kernel, top_k=limit)
+        rows = ranking.rows.tolist()
+        nxt = None
+        if rows and self.remaining() > len(rows):
+            last = rows[-1]
+            nxt = {"s": "", "o": len(rows), "k": [float(ranking.scores[last]), self.scored.batch.user_ids[last]]}
+        return explain_rows(self.scored, ranking, rows), nxt
+
+    async def snapshot(self, last_active: Dict[str, Any], kernel: ScoringKernel) -> Tuple[str, RankOrder]:
+        """Rank the whole feed now and keep the ranking for later pages."""
+        ranking = await self._order(last_active, kernel)
+        snap_id = secrets.token_urlsafe(6)
+        self.snapshots[snap_id] = ranking
+        while len(self.snapshots) > FEED_SNAPSHOTS:
+            self.snapshots.popitem(last=False)
+        return snap_id, ranking
+
+    def page(
+        self, snap_id: str, ranking: RankOrder, start: int, limit: int
+    ) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Up to `limit` results from position `start` of a snapshot, and the
+        cursor state for the next page (None at the end)."""
+        rows = []
+        pos = start
+        order = ranking.rows
+        while pos < len(order) and len(rows) < limit:
+            i = int(order[pos])
+            pos += 1
+            if not self.removed[i]:
+                rows.append(i)
+        if pos >= len(order) or not rows:
+            return explain_rows(self.scored, ranking, rows), None
+        last = rows[-1]
+        return explain_rows(self.scored, ranking, rows), {
+            "s": snap_id,
+            "o": pos,
+            "k": [float(ranking.scores[last]), self.scored.batch.user_ids[last]],
+        }
+
+    async def resume(
+        self, last_active: Dict[str, Any], kernel: ScoringKernel, key: List[Any]
+    ) -> Tuple[str, RankOrder, int]:
+        """New snapshot, positioned just after the (score, userId) key."""
+        snap_id, ranking = await self.snapshot(last_active, kernel)
+        score, uid = float(key[0]), str(key[1])
+        ids = self.scored.batch.user_ids
+        pos = 0
+        for pos, i in enumerate(ranking.rows.tolist()):
+            s = ranking.scores[i]
+            if s < score or (s == score and ids[i] > uid):
+                break
+        else:
+            pos = len(ranking.rows)
+        return snap_id, ranking, pos
+
+    async def _order(
+        self, last_active: Dict[str, Any], kernel: ScoringKernel, top_k: Optional[int] = None
+    ) -> RankOrder:
+        batch = self.scored.batch
+        n = len(batch.user_ids)
+        values = [last_active.get(uid) for uid in batch.user_ids]
+        if n >= RANK_POOL_MIN_CANDIDATES:
+            # Large courses encode the activity column in a thread; if a new
+            # user was appended meanwhile, encode again with them included
+            columns = await asyncio.to_thread(encode_last_active, values)
+            if len(batch.user_ids) == n:
+                batch.last_active_us, batch.has_last_active = columns
+            else:
+                set_last_active(batch, [last_active.get(uid) for uid in batch.user_ids])
+        else:
+            set_last_active(batch, values)
+        # Large courses are ordered in rank_pool's processes (off the event loop)
+        return await rank_pool.order(self.scored, kernel, exclude=self.removed, top_k=top_k)
+
+
+class FeedStore:
+    def __init__(self, max_mb: float = FEED_MAX_MB, max_age_s: float = FEED_MAX_AGE_S):
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_age_s = max_age_s
+        self._feeds: "OrderedDict[FeedKey, Feed]" = OrderedDict()
+        self._by_course: Dict[str, Set[FeedKey]] = {}
+        # Bumped by updates, per course and per (course, user) for swipes; a
+        # build that raced an update isn't stored.
+        self._epochs: Dict[Any, int] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+        self.row_updates = 0
+        self.dropped = 0
+
+    def epoch(self, course_code: str, user_id: str) -> Tuple[int, int]:
+        return self._epochs.get(course_code, 0), self._epochs.get((course_code, user_id), 0)
+
+    def get(self, course_code: str, user_id: str) -> Optional[Feed]:
+        key = (course_code, user_id)
+        feed = self._feeds.get(key)
+        if feed is not None and time.monotonic() - feed.built_at > self.max_age_s:
+            self._remove(key)
+            self.expired += 1
+            feed = None
+        if feed is None:
+            self.misses += 1
+            return None
+        self._feeds.move_to_end(key)
+        self.hits += 1
+        if feed.pending:
+            self._apply_pending(feed)
+        return feed
+
+    def put(
+        self,
+        course_code: str,
+        user_id: str,
+        scored: ScoredBatch,
+        swiped: Iterable[str],
+        pod_members: Iterable[str],
+        epoch: Tuple[int, int],
+    ) -> Feed:
+        """Wrap a freshly scored course as a feed; stored unless an update
+        for the course arrived since `epoch` was read."""
+        batch = scored.batch
+        row_of = {uid: i for i, uid in enumerate(batch.user_ids)}
+        removed = np.zeros(len(batch), dtype=bool)
+        for uid in swiped:
+            i = row_of.get(uid)
+            if i is not None:
+                removed[i] = True
+        feed = Feed(course_code, user_id, scored, row_of, removed, set(pod_members))
+        feed.nbytes = _feed_bytes(feed)
+
+        if epoch != self.epoch(course_code, user_id) or feed.nbytes > self.max_bytes:
+            return feed
+
+        key = (course_code, user_id)
+        self._remove(key)
+        self._feeds[key] = feed
+        self._by_course.setdefault(course_code, set()).add(key)
+        self.bytes += feed.nbytes
+        self._evict()
+        return feed
+
+    # Targeted updates
+
+    def swiped(self, course_code: str, user_id: str, target_id: str) -> None:
+        self._bump((course_code, user_id))
+        for key in self._keys(course_code):
+            feed = self._feeds[key]
+            if key[1] == user_id:
+                i = feed.row_of.get(target_id)
+                if i is not None and not feed.removed[i]:
+                    feed.removed[i] = True
+                    feed.version += 1
+
+    def profile_changed(self, course_code: str, profile: ProfileFeatures) -> None:
+        """O(1) per feed: the row is re-scored when the feed is next read."""
+        self._bump(course_code)
+        uid = profile.userId
+        for key in self._keys(course_code):
+            feed = self._feeds[key]
+            if feed.user_id == uid or uid in feed.pod_members:
+                self._remove(key)
+                self.dropped += 1
+                continue
+            feed.pending[uid] = profile
+
+    def pod_changed(self, course_code: str, member_ids: Iterable[str]) -> None:
+        self._bump(course_code)
+        members = set(member_ids)
+        for key in self._keys(course_code):
+            feed = self._feeds[key]
+            if feed.user_id in members or feed.pod_members & members:
+                self._remove(key)
+                self.dropped += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "feeds": len(self._feeds),
+            "mb": round(self.bytes / (1024 * 1024), 2),
+            "maxMb": round(self.max_bytes / (1024 * 1024), 2),
+            "maxAgeS": self.max_age_s,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expired": self.expired,
+            "rowUpdates": self.row_updates,
+            "dropped": self.dropped,
+        }
+
+    def _apply_pending(self, feed: Feed) -> None:
+        profiles, feed.pending = list(feed.pending.values()), {}
+        rows = update_batch(feed.scored.batch, feed.row_of, profiles)
+        if len(feed.removed) < len(feed.scored.batch):
+            feed.removed = np.concatenate(
+                [feed.removed, np.zeros(len(feed.scored.batch) - len(feed.removed), dtype=bool)]
+            )
+        rescore_rows(feed.scored, rows)
+        feed.version += 1
+        self.row_updates += len(rows)
+        self.resized(feed)
+
+    def _keys(self, course_code: str) -> List[FeedKey]:
+        return list(self._by_course.get(course_code, ()))
+
+    def _bump(self, key: Any) -> None:
+        self._epochs[key] = self._epochs.get(key, 0) + 1
+
+    def resized(self, feed: Feed) -> None:
+        """Re-account a stored feed after it grew (e.g. a new snapshot)."""
+        if self._feeds.get((feed.course_code, feed.user_id)) is feed:
+            self._resize(feed)
+
+    def _resize(self, feed: Feed) -> None:
+        nbytes = _feed_bytes(feed)
+        self.bytes += nbytes - feed.nbytes
+        feed.nbytes = nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        while self.bytes > self.max_bytes and self._feeds:
+            self._remove(next(iter(self._feeds)))
+            self.evictions += 1
+
+    def _remove(self, key: FeedKey) -> None:
+        feed = self._feeds.pop(key, None)
+        if feed is None:
+            return
+        self.bytes -= feed.nbytes
+        keys = self._by_course.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_course[key[0]]
+
+
+def encode_cursor(state: Dict[str, Any]) -> str:
+    raw = json.dumps(state, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    """Cursor state, or None if the token isn't one of ours."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        state = json.loads(raw)
+        if (
+            isinstance(state, dict)
+            and isinstance(state.get("s"), str)
+            and _is_int(state.get("o"))
+            and state["o"] >= 0
+            and isinstance(state.get("k"), list)
+            and len(state["k"]) == 2
+            and _is_number(state["k"][0])
+            and isinstance(state["k"][1], str)
+        ):
+            return state
+    except (binascii.Error, ValueError):
+        pass
+    return None
+
+
+def _is_int(v: Any) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def _is_number(v: Any) -> bool:
+    return (isinstance(v, (int, float)) and not isinstance(v, bool)) and math.isfinite(v)
+
+
+def _feed_bytes(feed: Feed) -> int:
+    """Rough footprint: arrays plus ~8 bytes per list slot and ~100 per dict entry."""
+    scored = feed.scored
+    batch = scored.batch
+    arrays = (
+        batch.uid_order, batch.primary, batch.role_hits, batch.skill_words, batch.skill_count,
+        batch.avail_mask, batch.avail_minutes, batch.last_active_us, batch.has_last_active,
+        scored.components, feed.removed,
+    )
+    snaps = sum(
+        r.rows.nbytes + r.scores.nbytes + r.activity_pts.nbytes + r.activity_bucket.nbytes
+        for r in feed.snapshots.values()
+    )
+    n = len(batch)
+    return sum(a.nbytes for a in arrays) + snaps + 8 * 4 * n + 100 * len(feed.row_of)
+
+
+feed_store = FeedStore()
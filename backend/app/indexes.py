@@ -0,0 +1,176 @@
+"""
+MongoDB index declarations and bootstrap.
+
+Every hot query in main.py has an index declared here. ensure_indexes() is
+idempotent (create_index is a no-op when the same index already exists) and
+runs at startup unless MONGO_AUTO_INDEXES=false, or on demand with:
+
+    python -m app indexes          # build, then report
+    python -m app indexes --check  # report only
+
+join_pod relies on the pods index being unique. Databases from before it
+was have a non-unique index of the same name: ensure_indexes() rebuilds it
+as unique when no user is in two pods of a course, and startup fails
+(listing the pods) while the unique index is missing.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+from pymongo.errors import OperationFailure
+
+from .db import _env_flag, col
+
+logger = logging.getLogger(__name__)
+
+AUTO_CREATE_INDEXES = _env_flag("MONGO_AUTO_INDEXES", True)
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: Tuple[Tuple[str, int], ...]
+    used_by: str
+    unique: bool = False
+
+    @property
+    def name(self) -> str:
+        return "_".join(f"{k}_{d}" for k, d in self.keys)
+
+
+INDEXES: List[IndexSpec] = [
+    IndexSpec("users", (("courseCodes", 1),), "candidate scan in /recommendations"),
+    IndexSpec(
+        "swipes",
+        (("fromUserId", 1), ("toUserId", 1), ("courseCode", 1)),
+        "swipe upsert and has_mutual_accept lookups",
+        unique=True,
+    ),
+    IndexSpec("swipes", (("fromUserId", 1), ("courseCode", 1)), "already-swiped set in /recommendations"),
+    IndexSpec(
+        "pods",
+        (("courseCode", 1), ("memberIds", 1)),
+        "pod lookup by member; one pod per user per course (join_pod)",
+        unique=True,
+    ),
+    IndexSpec(
+        "presence",
+        (("userId", 1), ("courseCode", 1)),
+        "heartbeat upsert",
+        unique=True,
+    ),
+    IndexSpec("presence", (("courseCode", 1), ("lastActiveAt", -1)), "get_last_active_map course scan"),
+    IndexSpec("courses", (("courseCode", 1),), "course lookup"),
+]
+
+POD_INDEX = next(spec for spec in INDEXES if spec.collection == "pods")
+
+
+class PodIndexError(RuntimeError):
+    """The unique pods index is missing, so join_pod can't keep users to one pod."""
+
+
+async def pod_conflicts() -> List[Tuple[str, str, List[str]]]:
+    """(courseCode, userId, podIds) for each user in more than one pod of a course."""
+    pipeline = [
+        {"$unwind": "$memberIds"},
+        {"$group": {
+            "_id": {"courseCode": "$courseCode", "userId": "$memberIds"},
+            "podIds": {"$addToSet": "$_id"},
+        }},
+        {"$match": {"podIds.1": {"$exists": True}}},
+    ]
+    return [
+        (d["_id"]["courseCode"], str(d["_id"]["userId"]), sorted(str(p) for p in d["podIds"]))
+        async for d in col("pods").aggregate(pipeline)
+    ]
+
+
+async def _upgrade_pod_index() -> None:
+    """Drop a non-unique pods index so ensure_indexes() rebuilds it unique,
+    unless existing pods would violate it."""
+    info = await col("pods").index_information()
+    ix = info.get(POD_INDEX.name)
+    if ix is None or ix.get("unique"):
+        return
+    conflicts = await pod_conflicts()
+    if conflicts:
+        logger.error(f"Not rebuilding pods.{POD_INDEX.name} as unique: {_describe(conflicts)}")
+        return
+    logger.info(f"Rebuilding pods.{POD_INDEX.name} as unique")
+    await col("pods").drop_index(POD_INDEX.name)
+
+
+def _describe(conflicts: List[Tuple[str, str, List[str]]]) -> str:
+    shown = "; ".join(f"user {uid} in pods {', '.join(pods)} ({code})" for code, uid, pods in conflicts[:20])
+    more = f" and {len(conflicts) - 20} more" if len(conflicts) > 20 else ""
+    return f"{len(conflicts)} users are in more than one pod of a course: {shown}{more}"
+
+
+async def ensure_indexes() -> List[IndexSpec]:
+    """Create every declared index; returns the ones that could not be built."""
+    failed: List[IndexSpec] = []
+    await _upgrade_pod_index()
+    for spec in INDEXES:
+        try:
+            await col(spec.collection).create_index(
+                list(spec.keys), name=spec.name, unique=spec.unique
+            )
+        except OperationFailure as e:
+            # e.g. duplicate data blocking a unique index, or a conflicting
+            # index with the same name; keep serving and report it.
+            logger.error(f"Could not build index {spec.collection}.{spec.name}: {e}")
+            failed.append(spec)
+    return failed
+
+
+async def missing_indexes() -> List[IndexSpec]:
+    """Declared indexes that don't exist (with matching keys and uniqueness) in the database."""
+    existing: Dict[str, List[Tuple[Tuple[Tuple[str, int], ...], bool]]] = {}
+    missing: List[IndexSpec] = []
+    for spec in INDEXES:
+        if spec.collection not in existing:
+            info = await col(spec.collection).index_information()
+            existing[spec.collection] = [
+                (tuple((k, int(d)) for k, d in ix["key"]), bool(ix.get("unique")))
+                for ix in info.values()
+            ]
+        # A non-unique index where a unique one is declared counts as missing.
+        if (spec.keys, spec.unique) not in existing[spec.collection]:
+            missing.append(spec)
+    return missing
+
+
+async def bootstrap_indexes() -> None:
+    """Startup hook: build indexes (if enabled) and warn about missing ones.
+    Raises PodIndexError when the unique pods index is missing."""
+    if AUTO_CREATE_INDEXES:
+        await ensure_indexes()
+    missing = await missing_indexes()
+    for spec in missing:
+        logger.warning(f"Missing index {spec.collection}.{spec.name} (used by {spec.used_by})")
+    if POD_INDEX in missing:
+        conflicts = await pod_conflicts()
+        if conflicts:
+            raise PodIndexError(
+                f"pods.{POD_INDEX.name} can't be made unique: {_describe(conflicts)}. "
+                "Move each user to one pod, then restart."
+            )
+        raise PodIndexError(f"pods.{POD_INDEX.name} is missing or not unique; run python -m app indexes")
+
+
+async def main(check_only: bool = False) -> int:
+    """CLI entry point; exit code 1 when any declared index is missing."""
+    if not check_only:
+        await ensure_indexes()
+    missing = await missing_indexes()
+    for spec in INDEXES:
+        state = "MISSING" if spec in missing else "ok"
+        print(f"{state:>7}  {spec.collection}.{spec.name}  ({spec.used_by})")
+    if POD_INDEX in missing:
+        conflicts = await pod_conflicts()
+        if conflicts:
+            print(_describe(conflicts))
+    return 1 if missing else 0
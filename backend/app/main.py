@@ -1,18 +1,31 @@
 from __future__ import annotations
 
-from fastapi import FastAPI, Header, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime, timezone
 from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 import os
 import asyncio
 
 import logging
+import secrets
+from .config import ADMIN_TOKEN, RANK_POOL_MIN_CANDIDATES
 from .platform_checks import run_platform_checks
-from .db import col, check_connection
-from .models import DemoAuthIn, DemoAuthOut, ProfileIn, SwipeIn, HubIn, AskIn, AskOut, CourseOut, TicketIn, TicketOut
-from .matching import rank_candidates
-from .snowflake_sync import write_user_to_snowflake, write_swipe_to_snowflake, write_pod_to_snowflake
+from .db import col, check_connection, CARD_VIEW, ID_VIEW, RANKING_VIEW, REVISION_VIEW, ROLES_VIEW
+from .indexes import bootstrap_indexes
+from .models import DemoAuthIn, DemoAuthOut, ProfileIn, SwipeIn, SwipeBatchIn, HubIn, AskIn, AskOut, CourseOut, TicketIn, TicketOut
+from .rank_engine import COMPONENTS, encode_profiles, score_batch
+from .feeds import decode_cursor, encode_cursor, feed_store
+from .rank_pool import rank_pool
+from .matching import DEFAULT_PROFILE, POD_MAX_MEMBERS
+from .weights import weight_registry
+from .pod_optimizer import form_pods
+from .profile_cache import profile_cache
+from .presence import presence_buffer, presence_index
+from .timing import StageTimer
+from .cards import candidate_card
 
 # Configure logging
 logging.basicConfig(
@@ -46,8 +59,18 @@ async def _startup():
     logger.info("Starting CourseCupid API...")
     run_platform_checks()
     await check_connection()
+    await bootstrap_indexes()
+    presence_buffer.start()
+    await presence_index.rebuild()
+    presence_index.start()
     logger.info("✅ Application startup complete")
 
+@app.on_event("shutdown")
+async def _shutdown():
+    await presence_index.stop()
+    await presence_buffer.stop()
+    rank_pool.stop()
+
 def require_user(x_user_id: str | None) -> ObjectId:
     if not x_user_id:
         raise HTTPException(status_code=401, detail="Missing X-User-Id")
@@ -64,6 +87,17 @@ async def health():
     except Exception as e:
         return {"ok": False, "db": "down", "error": str(e)}
 
+@app.get("/metrics")
+async def metrics():
+    """In-process cache and queue counters for this worker."""
+    return {
+        "profileCache": profile_cache.stats(),
+        "presenceBuffer": presence_buffer.stats(),
+        "presenceIndex": presence_index.stats(),
+        "feeds": feed_store.stats(),
+        "rankPool": rank_pool.stats(),
+    }
+
 @app.get("/course", response_model=CourseOut)
 async def get_course(courseCode: str):
     """Get course information including name, description, professor, location, and policies"""
@@ -99,8 +133,7 @@ async def auth_demo(body: DemoAuthIn):
     }
     res = await users.insert_one(doc)
     doc["_id"] = res.inserted_id
-    # Dual-write to Snowflake (non-blocking)
-    asyncio.create_task(write_user_to_snowflake(doc))
+    feed_store.profile_changed(body.courseCode, profile_cache.get(body.courseCode, doc))
     return DemoAuthOut(userId=str(res.inserted_id), displayName=doc["displayName"])
 
 @app.get("/user/courses")
@@ -152,6 +185,11 @@ async def add_course_to_user(courseCode: str, x_user_id: str | None = Header(def
         
         if result.matched_count == 0:
             raise HTTPException(404, "User not found")
+
+        # New candidate for everyone's feeds in that course
+        user_doc = await users.find_one({"_id": uid}, RANKING_VIEW)
+        if user_doc:
+            feed_store.profile_changed(courseCode, profile_cache.get(courseCode, user_doc))
         
         return {"ok": True, "courseCode": courseCode}
     except HTTPException:
@@ -176,14 +214,17 @@ async def upsert_profile(body: ProfileIn, x_user_id: str | None = Header(default
             {
                 "$addToSet": {"courseCodes": body.courseCode},
                 "$set": doc,
+                # Invalidates cached ranking features for this user
+                "$inc": {"profileRev": 1},
             },
             upsert=True,
         )
 
-        # Dual-write updated user to Snowflake (non-blocking)
-        user_doc = await users.find_one({"_id": uid})
+        user_doc = await users.find_one({"_id": uid}, {**RANKING_VIEW, "courseCodes": 1})
         if user_doc:
-            asyncio.create_task(write_user_to_snowflake(user_doc))
+            # Re-score this user in the feeds of every course they're in
+            for code in user_doc.get("courseCodes") or []:
+                feed_store.profile_changed(code, profile_cache.get(code, user_doc))
 
         return {"ok": True}
 
@@ -195,107 +236,288 @@ async def upsert_profile(body: ProfileIn, x_user_id: str | None = Header(default
 @app.post("/heartbeat")
 async def heartbeat(courseCode: str, x_user_id: str | None = Header(default=None, alias="X-User-Id")):
     uid = require_user(x_user_id)
-    presence = col("presence")
-    await presence.update_one(
-        {"userId": uid, "courseCode": courseCode},
-        {"$set": {"lastActiveAt": datetime.now(timezone.utc)}},
-        upsert=True,
-    )
+    # Buffered; written to presence in periodic bulk flushes
+    now = datetime.now(timezone.utc)
+    presence_buffer.record(uid, courseCode, now)
+    presence_index.touch(uid, courseCode, now)
     return {"ok": True}
 
 async def get_last_active_map(courseCode: str):
-    presence = col("presence")
-    cur = presence.find({"courseCode": courseCode})
-    m = {}
-    async for p in cur:
-        m[str(p["userId"])] = p.get("lastActiveAt")
-    return m
+    # Served from the resident presence index; read-only.
+    return await presence_index.course(courseCode)
+
+@app.get("/weight-profiles")
+async def weight_profiles(courseCode: str):
+    """Ranking modes available in a course (built-in, configured and course-specific)."""
+    kernels = await weight_registry.profiles(courseCode)
+    return {
+        "default": DEFAULT_PROFILE,
+        "profiles": [
+            {
+                "name": k.name,
+                "weights": {
+                    **{c: float(w) for c, w in zip(COMPONENTS, k.weights)},
+                    "activity": k.activity,
+                },
+            }
+            for k in kernels.values()
+        ],
+    }
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 200
 
 @app.get("/recommendations")
 async def recommendations(
     courseCode: str, 
+    response: Response,
     mode: str = "skillmatch",
+    limit: int | None = Query(default=None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str | None = None,
     x_user_id: str | None = Header(default=None, alias="X-User-Id")
 ):
+    """
+    Ranked candidates. With limit and/or cursor the response is one page plus
+    nextCursor (null on the last page); pass it back unchanged for the next
+    page. The first page is a top-`limit` select; the second ranks the feed
+    into a snapshot that serves the pages after it. Without either, the whole
+    feed is returned.
+    """
     try:
         uid = require_user(x_user_id)
         users = col("users")
-        swipes = col("swipes")
-        pods = col("pods")
     except Exception as e:
         logger.error(f"Error in recommendations: {e}")
         raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
 
-    # Validate mode
-    if mode not in ["quickmatch", "skillmatch"]:
-        mode = "skillmatch"  # Default to skillmatch if invalid
-
-    me = await users.find_one({"_id": uid})
-    if not me:
-        raise HTTPException(404, "User not found")
-
-    already = set()
-    async for s in swipes.find({"fromUserId": uid, "courseCode": courseCode}):
-        already.add(str(s["toUserId"]))
-
-    my_pod = await pods.find_one({"courseCode": courseCode, "memberIds": uid})
-    my_pod_roles = []
-    if my_pod:
-        async for member in users.find({"_id": {"$in": my_pod["memberIds"]}}):
-            if member.get("rolePrefs"):
-                my_pod_roles.extend(member["rolePrefs"])
-
-    last_active = await get_last_active_map(courseCode)
+    # Any registered weight profile (see weights.py); unknown names get the default
+    kernel = await weight_registry.kernel(courseCode, mode)
+    if kernel is None:
+        kernel = await weight_registry.kernel(courseCode, DEFAULT_PROFILE)
+    mode = kernel.name
+
+    state = None
+    if cursor is not None:
+        state = decode_cursor(cursor)
+        if state is None or state.get("c") != courseCode or state.get("m") != mode:
+            raise HTTPException(400, "Invalid cursor")
+
+    timer = StageTimer()
+    # One feed per viewer serves both modes; only the weights differ.
+    feed = feed_store.get(courseCode, str(uid))
+
+    if feed is None:
+        # The build read presence already; rank with the same map
+        feed, last_active = await build_feed(courseCode, uid, timer)
+    else:
+        last_active = await timer.run("presence", get_last_active_map(courseCode))
 
-    cand = []
-    async for u in users.find({"_id": {"$ne": uid}, "courseCodes": courseCode}):
-        if str(u["_id"]) in already:
-            continue
-        u["lastActiveAt"] = last_active.get(str(u["_id"]))
-        cand.append(u)
+    whole = cursor is None and limit is None
+    page_size = None if whole else limit or DEFAULT_PAGE_SIZE
+    next_cursor = None
     try:
-        ranked = rank_candidates(me, cand, my_pod_roles, mode=mode)
+        with timer.stage("rank"):
+            if whole:
+                ranked = await feed.rank(last_active, kernel)
+            else:
+                if state is None:
+                    # First page: top-K select, no snapshot
+                    ranked, nxt = await feed.top(last_active, kernel, page_size)
+                else:
+                    if state["s"] in feed.snapshots:
+                        snap_id, ranking, start = state["s"], feed.snapshots[state["s"]], state["o"]
+                    else:
+                        # No snapshot yet (after a first page) or gone (feed rebuilt,
+                        # another worker): rank one and resume after the last key
+                        snap_id, ranking, start = await feed.resume(last_active, kernel, state["k"])
+                    feed_store.resized(feed)
+                    ranked, nxt = feed.page(snap_id, ranking, start, page_size)
+                if nxt:
+                    next_cursor = encode_cursor({**nxt, "c": courseCode, "m": mode})
     except Exception:
-        logger.exception("rank_candidates crashed; falling back to simple order")
+        logger.exception("feed ranking crashed; falling back to simple order")
+        ids = [uid for uid, gone in zip(feed.scored.batch.user_ids, feed.removed) if not gone]
         ranked = [
-            {"userId": str(u["_id"]), "score": 0.0, "reasons": ["Fallback ranking (ranker error)"]}
-            for u in cand
+            {"userId": cid, "score": 0.0, "reasons": ["Fallback ranking (ranker error)"]}
+            for cid in ids[:page_size]
         ]
 
-    out = []
-    for r in ranked:
-        u = next((x for x in cand if str(x["_id"]) == r["userId"]), None)
-        if not u:
-            continue
+    # Cards only for the returned candidates, with the card view.
+    async def load_cards():
+        cards = {}
+        if ranked:
+            async for u in users.find({"_id": {"$in": [ObjectId(r["userId"]) for r in ranked]}}, CARD_VIEW):
+                u["lastActiveAt"] = last_active.get(str(u["_id"]))
+                cards[str(u["_id"])] = u
+        return cards
 
-        la = u.get("lastActiveAt")
-        if hasattr(la, "isoformat"):
-            la = la.isoformat()
+    cards = await timer.run("cards", load_cards())
 
-        out.append(
-            {
-                "userId": r["userId"],
-                "displayName": u.get("displayName", "Student"),
-                "rolePrefs": u.get("rolePrefs", []),
-                "skills": (u.get("skills") or [])[:6],
-                "availability": (u.get("availability") or [])[:3],
-                "lastActiveAt": la,
-                "score": float(r.get("score") or 0.0),
-                "reasons": [str(x) for x in (r.get("reasons") or [])],
-            }
-        )
+    out = [candidate_card(cards[r["userId"]], r) for r in ranked if r["userId"] in cards]
 
-    return {"candidates": out}
+    response.headers["Server-Timing"] = timer.header()
+    logger.debug(f"/recommendations {courseCode} n={len(feed.row_of)}: {timer.header()}")
+    return {"candidates": out, "nextCursor": next_cursor}
 
-async def has_mutual_accept(courseCode: str, a: ObjectId, b: ObjectId) -> bool:
+async def build_feed(courseCode: str, uid: ObjectId, timer: StageTimer):
+    """Score the whole course for uid (feed miss) and store it as a feed.
+    Returns (feed, the course's {userId: lastActiveAt} map it was built with)."""
+    users = col("users")
     swipes = col("swipes")
-    ab = await swipes.find_one({"courseCode": courseCode, "fromUserId": a, "toUserId": b, "decision": "accept"})
-    ba = await swipes.find_one({"courseCode": courseCode, "fromUserId": b, "toUserId": a, "decision": "accept"})
-    return bool(ab and ba)
+    pods = col("pods")
+    epoch = feed_store.epoch(courseCode, str(uid))
+
+    async def load_swiped():
+        already = set()
+        async for s in swipes.find({"fromUserId": uid, "courseCode": courseCode}, {"toUserId": 1}):
+            already.add(str(s["toUserId"]))
+        return already
+
+    async def load_pod():
+        my_pod = await pods.find_one({"courseCode": courseCode, "memberIds": uid}, {"memberIds": 1})
+        my_pod_roles = []
+        if my_pod:
+            async for member in users.find({"_id": {"$in": my_pod["memberIds"]}}, ROLES_VIEW):
+                if member.get("rolePrefs"):
+                    my_pod_roles.extend(member["rolePrefs"])
+            return my_pod_roles, [str(m) for m in my_pod["memberIds"]]
+        return my_pod_roles, []
+
+    async def load_candidates():
+        # Ranking reads only _id + profileRev; features come from the profile
+        # cache, and only misses fetch the ranking view.
+        profiles = []
+        stale = {}
+        async for u in users.find({"_id": {"$ne": uid}, "courseCodes": courseCode}, REVISION_VIEW):
+            f = profile_cache.peek(courseCode, str(u["_id"]), int(u.get("profileRev") or 0))
+            if f is None:
+                stale[u["_id"]] = len(profiles)
+            profiles.append(f)
+
+        if stale:
+            async for u in users.find({"_id": {"$in": list(stale)}}, RANKING_VIEW):
+                profiles[stale[u["_id"]]] = profile_cache.get(courseCode, u)
+        # Skip anyone deleted between the two reads
+        return [f for f in profiles if f is not None]
+
+    # Independent reads run concurrently; the candidate cursor streams while
+    # the smaller lookups finish.
+    me, already, (my_pod_roles, pod_members), last_active, profiles = await asyncio.gather(
+        timer.run("me", users.find_one({"_id": uid}, RANKING_VIEW)),
+        timer.run("swiped", load_swiped()),
+        timer.run("pod", load_pod()),
+        timer.run("presence", get_last_active_map(courseCode)),
+        timer.run("candidates", load_candidates()),
+    )
+    if not me:
+        raise HTTPException(404, "User not found")
+
+    # Swiped candidates stay in the batch, marked removed in the feed.
+    with timer.stage("score"):
+        me_features = profile_cache.get(courseCode, me)
+        # The course's vocabulary may have been replaced while the reads ran
+        vocab = me_features.vocab
+        profiles = [p.in_vocab(vocab) for p in profiles]
+        values = [last_active.get(p.userId) for p in profiles]
+        if len(profiles) >= RANK_POOL_MIN_CANDIDATES:
+            # Large courses encode and score in a thread, off the event loop
+            scored = await asyncio.to_thread(_encode_and_score, me_features, profiles, values, vocab, my_pod_roles)
+        else:
+            scored = _encode_and_score(me_features, profiles, values, vocab, my_pod_roles)
+    return feed_store.put(courseCode, str(uid), scored, already, pod_members, epoch), last_active
+
+def _encode_and_score(me_features, profiles, last_active, vocab, my_pod_roles):
+    return score_batch(me_features, encode_profiles(profiles, last_active, vocab), my_pod_roles)
+
+async def mutual_accepts(courseCode: str, uid: ObjectId, others: list[ObjectId]) -> set[ObjectId]:
+    """Which of `others` have a mutual accept with uid in this course, in one query."""
+    others = [o for o in others if o != uid]
+    if not others:
+        return set()
+
+    swipes = col("swipes")
+    accepted_by_me = set()
+    accepted_me = set()
+    cur = swipes.find(
+        {
+            "courseCode": courseCode,
+            "decision": "accept",
+            "$or": [
+                {"fromUserId": uid, "toUserId": {"$in": others}},
+                {"fromUserId": {"$in": others}, "toUserId": uid},
+            ],
+        },
+        {"fromUserId": 1, "toUserId": 1},
+    )
+    async for s in cur:
+        if s["fromUserId"] == uid:
+            accepted_by_me.add(s["toUserId"])
+        else:
+            accepted_me.add(s["fromUserId"])
+    return accepted_by_me & accepted_me
+
+async def has_mutual_accept(courseCode: str, a: ObjectId, b: ObjectId) -> bool:
+    return b in await mutual_accepts(courseCode, a, [b])
+
+JOIN_POD_ATTEMPTS = 3
 
-async def get_user_pod(courseCode: str, uid: ObjectId):
+async def join_pod(courseCode: str, a: ObjectId, b: ObjectId) -> tuple[bool, str]:
+    """
+    Put a mutually accepted pair in the same pod; returns (podUpdated, podId).
+
+    Atomic without a transaction: the unique (courseCode, memberIds) index
+    keeps each user in at most one pod per course, and the join is a single
+    conditional update that only matches pods with a free seat. The common
+    cases cost one round trip (join) or two (new pod).
+    """
     pods = col("pods")
-    return await pods.find_one({"courseCode": courseCode, "memberIds": uid})
+    pair = [a, b]
+    for _ in range(JOIN_POD_ATTEMPTS):
+        try:
+            before = await pods.find_one_and_update(
+                {
+                    "courseCode": courseCode,
+                    "memberIds": {"$in": pair},
+                    f"memberIds.{POD_MAX_MEMBERS - 1}": {"$exists": False},
+                },
+                {"$addToSet": {"memberIds": {"$each": pair}}},
+                projection={"memberIds": 1},
+                return_document=ReturnDocument.BEFORE,
+            )
+        except DuplicateKeyError:
+            # The one not in this pod is already in another.
+            raise HTTPException(409, "Both users already in different pods")
+        if before:
+            joined = a in before["memberIds"] and b in before["memberIds"]
+            if not joined:
+                feed_store.pod_changed(courseCode, [str(a), str(b)])
+            return not joined, str(before["_id"])
+
+        # No pod with a free seat holds either of them: a full pod, or none.
+        existing = await pods.find_one({"courseCode": courseCode, "memberIds": {"$in": pair}}, {"memberIds": 1})
+        if existing:
+            if a in existing["memberIds"] and b in existing["memberIds"]:
+                return False, str(existing["_id"])
+            raise HTTPException(409, "Pod is full")
+
+        doc = {
+            "courseCode": courseCode,
+            "memberIds": pair,
+            "leaderId": a,
+            "hubLink": None,
+            "createdAt": datetime.now(timezone.utc),
+        }
+        try:
+            res = await pods.insert_one(doc)
+        except DuplicateKeyError:
+            # A concurrent swipe put one of them in a pod first; join it.
+            doc.pop("_id", None)
+            continue
+
+        feed_store.pod_changed(courseCode, [str(a), str(b)])
+        return True, str(res.inserted_id)
+
+    raise HTTPException(409, "Pod changed concurrently, retry")
 
 @app.post("/swipe")
 async def swipe(body: SwipeIn, x_user_id: str | None = Header(default=None, alias="X-User-Id")):
@@ -307,8 +529,8 @@ async def swipe(body: SwipeIn, x_user_id: str | None = Header(default=None, alia
     if uid == target:
         raise HTTPException(400, "Cannot swipe self")
 
-    me = await users.find_one({"_id": uid, "courseCodes": body.courseCode})
-    other = await users.find_one({"_id": target, "courseCodes": body.courseCode})
+    me = await users.find_one({"_id": uid, "courseCodes": body.courseCode}, ID_VIEW)
+    other = await users.find_one({"_id": target, "courseCodes": body.courseCode}, ID_VIEW)
     if not me or not other:
         raise HTTPException(400, "Both users must be in the course")
 
@@ -317,6 +539,7 @@ async def swipe(body: SwipeIn, x_user_id: str | None = Header(default=None, alia
         {"$set": {"decision": body.decision, "createdAt": datetime.now(timezone.utc)}},
         upsert=True,
     )
+    feed_store.swiped(body.courseCode, str(uid), str(target))
 
     mutual = False
     pod_updated = False
@@ -325,41 +548,91 @@ async def swipe(body: SwipeIn, x_user_id: str | None = Header(default=None, alia
     if body.decision == "accept":
         mutual = await has_mutual_accept(body.courseCode, uid, target)
         if mutual:
-            pods = col("pods")
-            pod_me = await get_user_pod(body.courseCode, uid)
-            pod_other = await get_user_pod(body.courseCode, target)
-
-            if pod_me and pod_other and pod_me["_id"] != pod_other["_id"]:
-                raise HTTPException(409, "Both users already in different pods")
-            if pod_me and len(pod_me["memberIds"]) >= 4 and target not in pod_me["memberIds"]:
-                raise HTTPException(409, "Pod is full")
-
-            if not pod_me and not pod_other:
-                doc = {
-                    "courseCode": body.courseCode,
-                    "memberIds": [uid, target],
-                    "leaderId": uid,
-                    "hubLink": None,
-                    "createdAt": datetime.now(timezone.utc),
-                }
-                res = await pods.insert_one(doc)
-                pod_id = str(res.inserted_id)
-                pod_updated = True
-
-                # Dual-write new pod to Snowflake (non-blocking)
-                doc["_id"] = res.inserted_id
-                asyncio.create_task(write_pod_to_snowflake(doc))
-            else:
-                existing = pod_me or pod_other
-                if target not in existing["memberIds"]:
-                    if len(existing["memberIds"]) >= 4:
-                        raise HTTPException(409, "Pod is full")
-                    await pods.update_one({"_id": existing["_id"]}, {"$addToSet": {"memberIds": target}})
-                    pod_updated = True
-                pod_id = str(existing["_id"])
+            pod_updated, pod_id = await join_pod(body.courseCode, uid, target)
 
     return {"ok": True, "mutual": mutual, "podUpdated": pod_updated, "podId": pod_id}
 
+@app.post("/swipes/batch")
+async def swipe_batch(body: SwipeBatchIn, x_user_id: str | None = Header(default=None, alias="X-User-Id")):
+    """
+    Apply queued swipes in order. Each item gets the same result /swipe would
+    have returned for it, or {"ok": false, "status", "detail"} where /swipe
+    would have raised. Membership is one read, the swipes one bulk_write and
+    the mutual check one read; only mutual accepts touch pods.
+    """
+    uid = require_user(x_user_id)
+    users = col("users")
+    swipes = col("swipes")
+
+    results: list[dict | None] = [None] * len(body.swipes)
+    targets: list[ObjectId | None] = []
+    for i, s in enumerate(body.swipes):
+        target = ObjectId(s.targetUserId) if ObjectId.is_valid(s.targetUserId) else None
+        targets.append(target)
+        if target is None:
+            results[i] = {"ok": False, "status": 400, "detail": "Invalid targetUserId"}
+        elif target == uid:
+            results[i] = {"ok": False, "status": 400, "detail": "Cannot swipe self"}
+
+    ids = {t for t in targets if t is not None} | {uid}
+    courses_of = {}
+    async for u in users.find({"_id": {"$in": list(ids)}}, {"courseCodes": 1}):
+        courses_of[u["_id"]] = set(u.get("courseCodes") or [])
+
+    ops = []
+    accepts = []
+    now = datetime.now(timezone.utc)
+    for i, s in enumerate(body.swipes):
+        if results[i] is not None:
+            continue
+        target = targets[i]
+        if s.courseCode not in courses_of.get(uid, ()) or s.courseCode not in courses_of.get(target, ()):
+            results[i] = {"ok": False, "status": 400, "detail": "Both users must be in the course"}
+            continue
+        ops.append(UpdateOne(
+            {"fromUserId": uid, "toUserId": target, "courseCode": s.courseCode},
+            {"$set": {"decision": s.decision, "createdAt": now}},
+            upsert=True,
+        ))
+        if s.decision == "accept":
+            accepts.append(i)
+        results[i] = {"ok": True, "mutual": False, "podUpdated": False, "podId": None}
+
+    if ops:
+        # Ordered, so a repeated target ends on its last decision, as with /swipe.
+        await swipes.bulk_write(ops, ordered=True)
+        for i, s in enumerate(body.swipes):
+            if results[i] is not None and results[i]["ok"]:
+                feed_store.swiped(s.courseCode, str(uid), str(targets[i]))
+
+    if accepts:
+        # Each accept was ours at the time it was applied, so it is mutual
+        # when the target has accepted us.
+        accepted_me = set()
+        cur = swipes.find(
+            {
+                "toUserId": uid,
+                "decision": "accept",
+                "fromUserId": {"$in": list({targets[i] for i in accepts})},
+                "courseCode": {"$in": list({body.swipes[i].courseCode for i in accepts})},
+            },
+            {"fromUserId": 1, "courseCode": 1},
+        )
+        async for sw in cur:
+            accepted_me.add((sw["fromUserId"], sw["courseCode"]))
+
+        for i in accepts:
+            course_code = body.swipes[i].courseCode
+            if (targets[i], course_code) not in accepted_me:
+                continue
+            results[i]["mutual"] = True
+            try:
+                results[i]["podUpdated"], results[i]["podId"] = await join_pod(course_code, uid, targets[i])
+            except HTTPException as e:
+                results[i] = {"ok": False, "status": e.status_code, "detail": e.detail}
+
+    return {"results": results}
+
 @app.get("/pod")
 async def pod(courseCode: str, x_user_id: str | None = Header(default=None, alias="X-User-Id")):
     try:
@@ -379,7 +652,7 @@ async def pod(courseCode: str, x_user_id: str | None = Header(default=None, alia
     members = []
     last_active = await get_last_active_map(courseCode)
 
-    async for u in users.find({"_id": {"$in": p["memberIds"]}}):
+    async for u in users.find({"_id": {"$in": p["memberIds"]}}, CARD_VIEW):
         members.append({
             "userId": str(u["_id"]),
             "displayName": u.get("displayName", "Student"),
@@ -389,13 +662,8 @@ async def pod(courseCode: str, x_user_id: str | None = Header(default=None, alia
             "lastActiveAt": last_active.get(str(u["_id"])),
         })
 
-    unlocked = []
-    for m in members:
-        mid = ObjectId(m["userId"])
-        if mid == uid:
-            continue
-        if await has_mutual_accept(courseCode, uid, mid):
-            unlocked.append(m["userId"])
+    mutual = await mutual_accepts(courseCode, uid, [ObjectId(m["userId"]) for m in members])
+    unlocked = [m["userId"] for m in members if ObjectId(m["userId"]) in mutual]
 
     return {
         "hasPod": True,
@@ -422,6 +690,25 @@ async def set_hub(body: HubIn, x_user_id: str | None = Header(default=None, alia
     await pods.update_one({"_id": p["_id"]}, {"$set": {"hubLink": body.hubLink}})
     return {"ok": True}
 
+def require_admin(x_admin_token: str | None):
+    if not ADMIN_TOKEN or not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(403, "Admin token required")
+
+@app.post("/admin/pods/form")
+async def admin_form_pods(
+    courseCode: str,
+    profile: str = DEFAULT_PROFILE,
+    apply: bool = False,
+    x_admin_token: str | None = Header(default=None, alias="X-Admin-Token"),
+):
+    """Place every unpodded student of a course in a pod (dry run unless apply)."""
+    require_admin(x_admin_token)
+    kernel = await weight_registry.kernel(courseCode, profile)
+    if kernel is None:
+        raise HTTPException(400, f"Unknown weight profile: {profile}")
+    result = await form_pods(courseCode, kernel, apply=apply)
+    return result.to_dict()
+
 async def ask_ai_syllabus(question: str, syllabus_text: str) -> str:
     """Use OpenAI to answer questions about the syllabus intelligently with deep analysis."""
     try:
@@ -8,16 +8,18 @@ then overlapping availability, then stack compatibility (shared tools and known
 pairings like React + FastAPI), then recent activity. We also penalize near-
 identical profiles so the feed isn't repetitive.
 
-This file is wired into the backend:
-- backend/app/main.py -> from .matching import rank_candidates
-- /recommendations calls: rank_candidates(me, candidates, my_pod_roles)
+This file is the reference implementation. /recommendations runs the
+vectorized port in backend/app/rank_engine.py (rank_candidates_batch), which
+must produce the same scores and ordering and shares the helpers below:
+- rank_candidates(me, candidates, my_pod_roles)
 
 So we KEEP that call signature.
 """
 
-from dataclasses import dataclass
+import heapq
+from dataclasses import dataclass, field, replace
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 
 
 
@@ -31,8 +33,34 @@ WEIGHTS = {
     "diversity_penalty": 15.0,  # max penalty when profiles are near-identical
 }
 
+# Built-in weight profiles ("mode"). More can be registered without code
+# changes, from config or per course (see weights.py).
+WEIGHT_PROFILES = {
+    # Prioritize roles + skills (targeted matching)
+    "skillmatch": WEIGHTS,
+    # Prioritize activity + availability (fast active people)
+    "quickmatch": {
+        "role": 20.0,
+        "availability": 40.0,
+        "skills": 15.0,
+        "activity": 35.0,
+        "diversity_penalty": 15.0,
+    },
+}
+DEFAULT_PROFILE = "skillmatch"
+
+# Minimum points for a component to be offered as a reason
+REASON_THRESHOLDS = {
+    "role": 10.0,
+    "skills": 6.0,
+    "availability": 4.0,
+    "activity": 3.0,
+}
+
 # MVP roles in this repo (see backend/app/models.py)
 ALL_ROLES = ["Frontend", "Backend", "Matching", "Platform"]
+POD_MAX_MEMBERS = len(ALL_ROLES)
+POD_MIN_MEMBERS = 2  # a mutual accept forms a pod of two
 
 # Skills: normalize tokens to lowercase alnum (e.g., "UI/UX" -> "uiux")
 # Pairings for "medium boost for complement" (explicit + explainable)
@@ -51,7 +79,7 @@ SKILL_SYNERGY_PAIRS = {
 
 # Availability blocks in this MVP (src/pages/ProfileBuilder.tsx):
 # "Mon evening", "Sat morning", ...
-# Convert to fixed week-minute intervals so overlap is measurable.
+# Overlap is measured in minutes using the block ranges below.
 DAY_TO_IDX = {"Mon": 0, "Tue": 1, "Wed": 2, "Thu": 3, "Fri": 4, "Sat": 5, "Sun": 6}
 BLOCK_TO_RANGE = {
     "morning": (9 * 60, 12 * 60),
@@ -60,6 +88,21 @@ BLOCK_TO_RANGE = {
     "night": (21 * 60, 24 * 60),  # not currently used, but safe
 }
 
+# Availability is stored as an int bitmask with one bit per (day, block),
+# block-major: bit = block * 7 + day. Overlap is AND + popcount, and the bit for
+# "same day, previous block" is always 7 positions lower. Blocks must not
+# overlap each other or wrap past midnight.
+AVAIL_DAYS = len(DAY_TO_IDX)
+AVAIL_DAY_BITS = (1 << AVAIL_DAYS) - 1
+AVAIL_BLOCKS = sorted(BLOCK_TO_RANGE, key=lambda b: BLOCK_TO_RANGE[b][0])
+AVAIL_BLOCK_MINUTES = [BLOCK_TO_RANGE[b][1] - BLOCK_TO_RANGE[b][0] for b in AVAIL_BLOCKS]
+# Bits whose block starts exactly where the previous block ends (merged runs)
+AVAIL_CONTINUES = sum(
+    AVAIL_DAY_BITS << (b * AVAIL_DAYS)
+    for b in range(1, len(AVAIL_BLOCKS))
+    if BLOCK_TO_RANGE[AVAIL_BLOCKS[b - 1]][1] >= BLOCK_TO_RANGE[AVAIL_BLOCKS[b]][0]
+)
+
 
 @dataclass
 class Ranked:
@@ -69,6 +112,25 @@ class Ranked:
     breakdown: Dict[str, float]
 
 
+@dataclass
+class ProfileFeatures:
+    """A profile normalized for ranking; skills are bits in a course SkillVocab."""
+    userId: str
+    rev: int
+    roles: List[str]
+    primary: str
+    skills: int
+    availability: int
+    vocab: Optional["SkillVocab"] = field(default=None, repr=False, compare=False)  # whose bits `skills` are
+
+    def in_vocab(self, vocab: "SkillVocab") -> "ProfileFeatures":
+        """These features with skills as bits of `vocab` (e.g. after the
+        profile cache replaced the course's vocabulary)."""
+        if self.vocab is vocab or self.vocab is None:
+            return self
+        return replace(self, skills=vocab.mask(self.vocab.decode(self.skills)), vocab=vocab)
+
+
 def rank_candidates(
     me: Dict[str, Any],
     candidates: List[Dict[str, Any]],
@@ -76,6 +138,7 @@ def rank_candidates(
     prior_swipes: Optional[Sequence[Any]] = None,
     debug: bool = False,
     mode: str = "skillmatch",
+    top_k: Optional[int] = None,
 ) -> List[Dict[str, Any]]:
     """
     Returns a ranked list:
@@ -91,30 +154,18 @@ def rank_candidates(
     mode: "quickmatch" or "skillmatch"
     - quickmatch: Prioritize activity + availability (fast active people)
     - skillmatch: Prioritize roles + skills (targeted matching)
+
+    top_k: only return the best top_k (same order as a full sort); reasons and
+    breakdowns are built for those only.
     """
-    # Adjust weights based on mode
-    if mode == "quickmatch":
-        weights = {
-            "role": 20.0,          # Lower priority
-            "availability": 40.0,  # Higher priority
-            "skills": 15.0,        # Lower priority
-            "activity": 35.0,      # Higher priority
-            "diversity_penalty": 15.0,
-        }
-    else:  # skillmatch (default)
-        weights = {
-            "role": 50.0,          # Highest priority
-            "availability": 20.0,
-            "skills": 20.0,
-            "activity": 10.0,
-            "diversity_penalty": 15.0,
-        }
-    
+    weights = _weights_for_mode(mode)
+
     now = datetime.now(timezone.utc)
 
     me_roles = _norm_roles(me.get("rolePrefs", []))
     me_primary = me_roles[0] if me_roles else ""
-    me_skills = _norm_skills(me.get("skills", []))
+    vocab = SkillVocab()
+    me_skills = vocab.mask(_norm_skills(me.get("skills", [])))
     me_avail = _norm_availability(me.get("availability", []))
 
     pod_roles, member_count = _extract_pod_state(my_pod_roles_or_state)
@@ -122,20 +173,19 @@ def rank_candidates(
 
     swiped_ids = _extract_swiped_ids(prior_swipes)
 
-    ranked: List[Ranked] = []
+    scored: List[Tuple[float, str, Tuple[Any, ...]]] = []
 
     for c in candidates:
-        cid = c.get("userId") or c.get("id") or c.get("user_id") or c.get("_id")
-        if cid is None:
+        user_id = _candidate_id(c)
+        if user_id is None:
             continue
-        user_id = str(cid)
 
         if user_id in swiped_ids:
             continue
 
         c_roles = _norm_roles(c.get("rolePrefs", []))
         c_primary = c_roles[0] if c_roles else ""
-        c_skills = _norm_skills(c.get("skills", []))
+        c_skills = vocab.mask(_norm_skills(c.get("skills", [])))
         c_avail = _norm_availability(c.get("availability", []))
 
         last_active = _parse_dt(
@@ -149,10 +199,10 @@ def rank_candidates(
             missing_roles=missing_roles,
             in_pod=bool(pod_roles),
         )
-        skills_s, skills_meta = _skills_score(me_skills, c_skills)
+        skills_s, shared, union = _skills_score(vocab, me_skills, c_skills)
         avail_s, avail_meta = _availability_score(me_avail, c_avail)
         activity_s, activity_reason = _activity_score(last_active, now)
-        diversity_pen = _diversity_penalty(me_primary, me_skills, c_primary, c_skills)
+        diversity_pen = _diversity_penalty(me_primary, c_primary, shared, union)
 
         role_pts = weights["role"] * role_s
         skills_pts = weights["skills"] * skills_s
@@ -162,6 +212,25 @@ def rank_candidates(
 
         total = role_pts + skills_pts + avail_pts + activity_pts - penalty_pts
 
+        scored.append(
+            (
+                round(total, 2),
+                user_id,
+                (role_reason, role_pts, skills_pts, avail_pts, activity_reason, activity_pts, penalty_pts, c_skills, avail_meta),
+            )
+        )
+
+    # Deterministic order (score desc, then userId asc)
+    if top_k is not None:
+        scored = heapq.nsmallest(max(0, top_k), scored, key=lambda t: (-t[0], t[1]))
+    else:
+        scored.sort(key=lambda t: (-t[0], t[1]))
+
+    ranked: List[Ranked] = []
+
+    for score, user_id, parts in scored:
+        role_reason, role_pts, skills_pts, avail_pts, activity_reason, activity_pts, penalty_pts, c_skills, avail_meta = parts
+
         breakdown = {
             "role": round(role_pts, 2),
             "skills": round(skills_pts, 2),
@@ -170,6 +239,9 @@ def rank_candidates(
             "diversityPenalty": round(-penalty_pts, 2),
         }
 
+        # Shared/synergy names are only needed when the skills reason can show.
+        skills_meta = _skills_meta(vocab, me_skills, c_skills) if skills_pts > REASON_THRESHOLDS["skills"] else {}
+
         reasons = _pick_top_reasons(
             role_reason=role_reason,
             role_pts=role_pts,
@@ -184,15 +256,12 @@ def rank_candidates(
         ranked.append(
             Ranked(
                 userId=user_id,
-                score=round(total, 2),
+                score=score,
                 reasons=reasons,
                 breakdown=breakdown,
             )
         )
 
-    # Deterministic sort (score desc, then userId asc)
-    ranked.sort(key=lambda r: (-r.score, r.userId))
-
     if debug:
         _debug_print_top5(ranked)
 
@@ -203,6 +272,14 @@ def rank_candidates(
 
 
 
+# Mode weights
+
+
+def _weights_for_mode(mode: str) -> Dict[str, float]:
+    return WEIGHT_PROFILES.get(mode, WEIGHT_PROFILES[DEFAULT_PROFILE])
+
+
+
 # Role scoring
 
 
@@ -259,24 +336,103 @@ def _role_score_and_reason(
 # Skills scoring
 
 
-def _skills_score(me_skills: set, c_skills: set) -> Tuple[float, Dict[str, Any]]:
+class SkillVocab:
+    """
+    Interns normalized skill tokens (as _norm_skills produces them) to bit
+    positions, so a profile's skills become one int bitmask and overlap is
+    AND + popcount.
+
+    Tokens from SKILL_SYNERGY_PAIRS are interned first, so they occupy the low
+    bits and synergy[i] is the mask of skills that pair with bit i.
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
+        for a, b in sorted(SKILL_SYNERGY_PAIRS):
+            self.intern(a)
+            self.intern(b)
+
+        self.synergy: List[int] = [0] * len(self.tokens)
+        for a, b in SKILL_SYNERGY_PAIRS:
+            ia, ib = self.ids[a], self.ids[b]
+            self.synergy[ia] |= 1 << ib
+            self.synergy[ib] |= 1 << ia
+        self.synergy_bits = (1 << len(self.synergy)) - 1
+
+    def __len__(self) -> int:
+        return len(self.tokens)
+
+    def intern(self, token: str) -> int:
+        i = self.ids.get(token)
+        if i is None:
+            i = len(self.tokens)
+            self.ids[token] = i
+            self.tokens.append(token)
+        return i
+
+    def mask(self, tokens: Iterable[str], add: bool = True) -> int:
+        """Bitmask for tokens; with add=False unknown tokens are left out."""
+        m = 0
+        for t in tokens:
+            i = self.intern(t) if add else self.ids.get(t)
+            if i is not None:
+                m |= 1 << i
+        return m
+
+    def decode(self, mask: int) -> List[str]:
+        out: List[str] = []
+        while mask:
+            low = mask & -mask
+            out.append(self.tokens[low.bit_length() - 1])
+            mask ^= low
+        return out
+
+    def synergy_count(self, me: int, c: int) -> int:
+        """Number of SKILL_SYNERGY_PAIRS with one side in me and the other in c."""
+        both = me & c
+        hits = 0
+        twice = 0
+        m = me & self.synergy_bits
+        while m:
+            low = m & -m
+            adj = self.synergy[low.bit_length() - 1]
+            hits += (adj & c).bit_count()
+            if both & low:
+                # A pair with both skills on both sides was counted from each end.
+                twice += (adj & both).bit_count()
+            m ^= low
+        return hits - twice // 2
+
+
+def _skills_score(vocab: SkillVocab, me_skills: int, c_skills: int) -> Tuple[float, int, int]:
+    """Returns (score, shared skill count, union skill count)."""
     if not me_skills and not c_skills:
-        return 0.0, {"shared": [], "synergy": []}
+        return 0.0, 0, 0
 
-    inter = sorted(me_skills & c_skills)
-    union = me_skills | c_skills
-    jacc = (len(inter) / len(union)) if union else 0.0
+    shared = (me_skills & c_skills).bit_count()
+    union = (me_skills | c_skills).bit_count()
+    jacc = (shared / union) if union else 0.0
+
+    overlap_component = 0.25 * jacc
+    complement_component = 0.65 * min(1.0, vocab.synergy_count(me_skills, c_skills) / 2.0)
+    score = min(1.0, overlap_component + complement_component)
+
+    return score, shared, union
+
+
+def _skills_meta(vocab: SkillVocab, me_skills: int, c_skills: int) -> Dict[str, Any]:
+    inter = sorted(vocab.decode(me_skills & c_skills))
+    union = (me_skills | c_skills).bit_count()
+    jacc = (len(inter) / union) if union else 0.0
 
     synergy_hits: List[Tuple[str, str]] = []
     for a, b in SKILL_SYNERGY_PAIRS:
-        if (a in me_skills and b in c_skills) or (b in me_skills and a in c_skills):
+        ba, bb = 1 << vocab.ids[a], 1 << vocab.ids[b]
+        if (me_skills & ba and c_skills & bb) or (me_skills & bb and c_skills & ba):
             synergy_hits.append((a, b))
 
-    overlap_component = 0.25 * jacc
-    complement_component = 0.65 * min(1.0, len(synergy_hits) / 2.0)
-    score = min(1.0, overlap_component + complement_component)
-
-    return score, {
+    return {
         "shared": inter[:5],
         "synergy": synergy_hits[:3],
         "jaccard": round(jacc, 3),
@@ -288,50 +444,33 @@ def _skills_score(me_skills: set, c_skills: set) -> Tuple[float, Dict[str, Any]]
 # Availability scoring
 
 
-def _availability_score(me_avail: List[Tuple[int, int]], c_avail: List[Tuple[int, int]]) -> Tuple[float, Dict[str, Any]]:
+def _availability_score(me_avail: int, c_avail: int) -> Tuple[float, Dict[str, Any]]:
     if not me_avail or not c_avail:
         return 0.0, {"overlapMinutes": 0, "overlapBlocks": 0}
 
-    overlap = _interval_overlap_minutes(me_avail, c_avail)
-    denom = max(1, min(_total_minutes(me_avail), _total_minutes(c_avail)))
+    both = me_avail & c_avail
+    overlap = _mask_minutes(both)
+    denom = max(1, min(_mask_minutes(me_avail), _mask_minutes(c_avail)))
     ratio = max(0.0, min(1.0, overlap / denom))
 
     return ratio, {
         "overlapMinutes": int(overlap),
-        "overlapBlocks": _rough_overlap_blocks(me_avail, c_avail),
+        "overlapBlocks": _overlap_blocks(both),
     }
 
 
-def _interval_overlap_minutes(a: List[Tuple[int, int]], b: List[Tuple[int, int]]) -> int:
-    a = sorted(a)
-    b = sorted(b)
-    i = j = 0
-    overlap = 0
-    while i < len(a) and j < len(b):
-        s1, e1 = a[i]
-        s2, e2 = b[j]
-        s = max(s1, s2)
-        e = min(e1, e2)
-        if e > s:
-            overlap += e - s
-        if e1 < e2:
-            i += 1
-        else:
-            j += 1
-    return overlap
-
+def _mask_minutes(mask: int) -> int:
+    total = 0
+    for b, minutes in enumerate(AVAIL_BLOCK_MINUTES):
+        total += minutes * ((mask >> (b * AVAIL_DAYS)) & AVAIL_DAY_BITS).bit_count()
+    return total
 
-def _total_minutes(intervals: List[Tuple[int, int]]) -> int:
-    return sum(max(0, e - s) for s, e in intervals)
 
-
-def _rough_overlap_blocks(me_avail: List[Tuple[int, int]], c_avail: List[Tuple[int, int]]) -> int:
-    count = 0
-    for s1, e1 in me_avail:
-        for s2, e2 in c_avail:
-            if min(e1, e2) > max(s1, s2):
-                count += 1
-    return count
+def _overlap_blocks(both: int) -> int:
+    # Each contiguous run of shared slots within a day is one overlapping
+    # (my block, their block) pair once adjacent blocks are merged.
+    continued = (both << AVAIL_DAYS) & AVAIL_CONTINUES
+    return (both & ~continued).bit_count()
 
 
 
@@ -359,12 +498,11 @@ def _activity_score(last_active: datetime | None, now: datetime) -> Tuple[float,
 # Diversity penalty
 
 
-def _diversity_penalty(me_role: str, me_skills: set, c_role: str, c_skills: set) -> float:
+def _diversity_penalty(me_role: str, c_role: str, shared: int, union: int) -> float:
     if not me_role or not c_role or me_role != c_role:
         return 0.0
 
-    union = me_skills | c_skills
-    skill_sim = (len(me_skills & c_skills) / len(union)) if union else 1.0
+    skill_sim = (shared / union) if union else 1.0
     if skill_sim >= 0.8:
         return min(1.0, (skill_sim - 0.8) / 0.2)
     return 0.0
@@ -383,13 +521,15 @@ def _pick_top_reasons(
     avail_pts: float,
     activity_reason: str,
     activity_pts: float,
+    thresholds: Optional[Dict[str, float]] = None,
 ) -> List[str]:
+    t = thresholds or REASON_THRESHOLDS
     options: List[Tuple[float, str]] = []
 
-    if role_pts > 10:
+    if role_pts > t["role"]:
         options.append((role_pts, role_reason))
 
-    if skills_pts > 6:
+    if skills_pts > t["skills"]:
         if skills_meta.get("synergy"):
             a, b = skills_meta["synergy"][0]
             options.append((skills_pts, f"complementary stack: {a} + {b}"))
@@ -397,12 +537,12 @@ def _pick_top_reasons(
             shared = ", ".join(skills_meta["shared"][:3])
             options.append((skills_pts, f"shared tools: {shared}"))
 
-    if avail_pts > 4:
+    if avail_pts > t["availability"]:
         blocks = int(avail_meta.get("overlapBlocks", 0) or 0)
         if blocks > 0:
             options.append((avail_pts, f"overlapping availability ({blocks} block{'s' if blocks != 1 else ''})"))
 
-    if activity_pts > 3:
+    if activity_pts > t["activity"]:
         options.append((activity_pts, activity_reason))
 
     options.sort(key=lambda x: -x[0])
@@ -418,6 +558,24 @@ def _pick_top_reasons(
 # Normalization helpers
 
 
+def normalize_profile(doc: Dict[str, Any], vocab: "SkillVocab") -> ProfileFeatures:
+    roles = _norm_roles(doc.get("rolePrefs", []))
+    return ProfileFeatures(
+        userId=_candidate_id(doc) or "",
+        rev=int(doc.get("profileRev") or 0),
+        roles=roles,
+        primary=roles[0] if roles else "",
+        skills=vocab.mask(_norm_skills(doc.get("skills", []))),
+        availability=_norm_availability(doc.get("availability", [])),
+        vocab=vocab,
+    )
+
+
+def _candidate_id(c: Dict[str, Any]) -> Optional[str]:
+    cid = c.get("userId") or c.get("id") or c.get("user_id") or c.get("_id")
+    return None if cid is None else str(cid)
+
+
 def _norm_roles(roles: Sequence[Any]) -> List[str]:
     out: List[str] = []
     for r in roles or []:
@@ -444,8 +602,8 @@ def _norm_skills(skills: Sequence[Any]) -> set:
     return out
 
 
-def _norm_availability(avail: Sequence[Any]) -> List[Tuple[int, int]]:
-    intervals: List[Tuple[int, int]] = []
+def _norm_availability(avail: Sequence[Any]) -> int:
+    mask = 0
 
     for item in avail or []:
         s = str(item).strip()
@@ -457,24 +615,9 @@ def _norm_availability(avail: Sequence[Any]) -> List[Tuple[int, int]]:
 
         day, block = parts[0], parts[1].lower()
         if day in DAY_TO_IDX and block in BLOCK_TO_RANGE:
-            base = DAY_TO_IDX[day] * 1440
-            s0, e0 = BLOCK_TO_RANGE[block]
-            intervals.append((base + s0, base + e0))
-
-    return _merge_intervals(sorted(intervals))
+            mask |= 1 << (AVAIL_BLOCKS.index(block) * AVAIL_DAYS + DAY_TO_IDX[day])
 
-
-def _merge_intervals(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
-    if not intervals:
-        return []
-    merged = [intervals[0]]
-    for s, e in intervals[1:]:
-        ps, pe = merged[-1]
-        if s <= pe:
-            merged[-1] = (ps, max(pe, e))
-        else:
-            merged.append((s, e))
-    return merged
+    return mask
 
 
 def _parse_dt(v: Any, now: datetime) -> datetime | None:
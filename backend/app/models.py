@@ -49,6 +49,9 @@ class SwipeIn(BaseModel):
     targetUserId: str
     decision: Literal["accept", "pass"]
 
+class SwipeBatchIn(BaseModel):
+    swipes: List[SwipeIn] = Field(min_length=1, max_length=200)
+
 class HubIn(BaseModel):
     courseCode: str
     hubLink: str
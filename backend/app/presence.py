@@ -0,0 +1,338 @@
+"""Presence: write-behind heartbeat buffer and resident per-course index."""
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from .config import (
+    PRESENCE_CHANGE_STREAM,
+    PRESENCE_FLUSH_INTERVAL_S,
+    PRESENCE_FLUSH_MAX_PENDING,
+    PRESENCE_INDEX_MAX_COURSES,
+    PRESENCE_REFRESH_S,
+    PRESENCE_STREAM_RETRY_MAX_S,
+    PRESENCE_STREAM_RETRY_MIN_S,
+)
+from .db import HISTORY_LOST, NOT_REPLICA_SET, col
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceBuffer:
+    """
+    Coalesces heartbeats per (userId, courseCode) and writes them to the
+    presence collection as one unordered bulk_write every flush_interval
+    seconds, or as soon as max_pending keys are waiting.
+
+    Writes use $max, so a late flush never moves lastActiveAt backwards when
+    several workers buffer the same user. Buffered values are visible to
+    reads through last_active()/overlay() before they reach Mongo.
+    """
+
+    def __init__(
+        self,
+        flush_interval: float = PRESENCE_FLUSH_INTERVAL_S,
+        max_pending: int = PRESENCE_FLUSH_MAX_PENDING,
+    ):
+        self.flush_interval = flush_interval
+        self.max_pending = max(1, max_pending)
+        self._pending: Dict[Tuple[ObjectId, str], datetime] = {}
+        self._lock = asyncio.Lock()
+        self._loop_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self.heartbeats = 0
+        self.writes = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def record(self, user_id: ObjectId, course_code: str, ts: datetime) -> None:
+        key = (user_id, course_code)
+        prev = self._pending.get(key)
+        if prev is None or ts > prev:
+            self._pending[key] = ts
+        self.heartbeats += 1
+
+        if len(self._pending) >= self.max_pending and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    def last_active(self, user_id: ObjectId, course_code: str) -> Optional[datetime]:
+        return self._pending.get((user_id, course_code))
+
+    def overlay(self, course_code: str, last_active: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply buffered heartbeats for a course onto a {userId: lastActiveAt} map."""
+        for (uid, code), ts in self._pending.items():
+            if code == course_code:
+                last_active[str(uid)] = _latest(last_active.get(str(uid)), ts)
+        return last_active
+
+    async def flush(self) -> int:
+        async with self._lock:
+            if not self._pending:
+                return 0
+            batch, self._pending = self._pending, {}
+
+            ops = [
+                UpdateOne(
+                    {"userId": uid, "courseCode": code},
+                    {"$max": {"lastActiveAt": ts}},
+                    upsert=True,
+                )
+                for (uid, code), ts in batch.items()
+            ]
+            try:
+                await col("presence").bulk_write(ops, ordered=False)
+            except Exception as e:
+                # Put them back (newer heartbeats win) and retry next tick.
+                self.failed_flushes += 1
+                logger.warning(f"Presence flush of {len(ops)} updates failed: {e}")
+                for key, ts in batch.items():
+                    self._pending[key] = _latest(self._pending.get(key), ts)
+                return 0
+
+            self.flushes += 1
+            self.writes += len(ops)
+            return len(ops)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Presence flush loop error")
+
+    def start(self) -> None:
+        if self._loop_task is None:
+            self._loop_task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write out whatever is still buffered."""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": len(self._pending),
+            "heartbeats": self.heartbeats,
+            "writes": self.writes,
+            "flushes": self.flushes,
+            "failedFlushes": self.failed_flushes,
+            "flushIntervalS": self.flush_interval,
+            "maxPending": self.max_pending,
+        }
+
+
+class PresenceIndex:
+    """
+    lastActiveAt per user for up to max_courses courses, held in memory so
+    /recommendations and /pod never scan the presence collection.
+
+    Heartbeats update it directly (touch). A course that isn't resident is
+    loaded from Mongo on first read, plus any heartbeats still buffered, and
+    the least recently read course is evicted past max_courses. With
+    PRESENCE_CHANGE_STREAM on, writes flushed by other workers are applied
+    from a change stream on the presence collection; a failed stream is
+    reopened after a backoff, resuming after the last change it applied.
+    Whenever no stream is running (off, failed, or between retries), the
+    resident courses are reloaded every refresh_s instead.
+    """
+
+    def __init__(
+        self,
+        buffer: PresenceBuffer,
+        max_courses: int = PRESENCE_INDEX_MAX_COURSES,
+        change_stream: bool = PRESENCE_CHANGE_STREAM,
+        refresh_s: float = PRESENCE_REFRESH_S,
+        retry_min_s: float = PRESENCE_STREAM_RETRY_MIN_S,
+        retry_max_s: float = PRESENCE_STREAM_RETRY_MAX_S,
+    ):
+        self.buffer = buffer
+        self.max_courses = max(1, max_courses)
+        self.change_stream = change_stream
+        self.refresh_s = refresh_s
+        self.retry_min_s = retry_min_s
+        self.retry_max_s = max(retry_min_s, retry_max_s)
+        self._courses: "OrderedDict[str, Dict[str, datetime]]" = OrderedDict()
+        self._stream_task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._streaming = False
+        self.loads = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.stream_events = 0
+        self.stream_restarts = 0
+
+    def touch(self, user_id: Any, course_code: str, ts: datetime) -> None:
+        m = self._courses.get(course_code)
+        # Non-resident courses pick the value up from Mongo/buffer on load.
+        if m is not None:
+            uid = str(user_id)
+            m[uid] = _latest(m.get(uid), _utc(ts))
+
+    async def course(self, course_code: str) -> Dict[str, datetime]:
+        """{userId: lastActiveAt} for a course. Read-only view; don't mutate."""
+        m = self._courses.get(course_code)
+        if m is None:
+            m = await self._load(course_code)
+        elif course_code in self._courses:
+            self._courses.move_to_end(course_code)
+        return m
+
+    async def last_active(self, course_code: str, user_id: Any) -> Optional[datetime]:
+        return (await self.course(course_code)).get(str(user_id))
+
+    async def active_within(self, course_code: str, hours: float) -> List[str]:
+        """User ids active in the last `hours`, most recent first."""
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=hours)
+        m = await self.course(course_code)
+        recent = [(ts, uid) for uid, ts in m.items() if ts >= cutoff]
+        recent.sort(reverse=True)
+        return [uid for _, uid in recent]
+
+    async def _load(self, course_code: str) -> Dict[str, datetime]:
+        m: Dict[str, datetime] = {}
+        async for p in col("presence").find({"courseCode": course_code}, {"userId": 1, "lastActiveAt": 1}):
+            if p.get("lastActiveAt") is not None:
+                m[str(p["userId"])] = _utc(p["lastActiveAt"])
+        self.buffer.overlay(course_code, m)
+
+        # Another coroutine may have loaded it while we awaited.
+        existing = self._courses.get(course_code)
+        if existing is not None:
+            for uid, ts in m.items():
+                existing[uid] = _latest(existing.get(uid), ts)
+            return existing
+
+        self._courses[course_code] = m
+        self.loads += 1
+        while len(self._courses) > self.max_courses:
+            self._courses.popitem(last=False)
+            self.evictions += 1
+        return m
+
+    async def rebuild(self) -> None:
+        """Startup: load the most recently active courses, up to max_courses."""
+        self._courses.clear()
+        pipeline = [
+            {"$group": {"_id": "$courseCode", "latest": {"$max": "$lastActiveAt"}}},
+            {"$sort": {"latest": -1}},
+            {"$limit": self.max_courses},
+        ]
+        codes = [d["_id"] async for d in col("presence").aggregate(pipeline) if d.get("_id")]
+        for code in reversed(codes):
+            await self._load(code)
+
+    async def refresh(self) -> None:
+        """Reload every resident course from Mongo (merged, never older)."""
+        for code in list(self._courses):
+            if code in self._courses:
+                await self._load(code)
+        self.refreshes += 1
+
+    async def _watch(self) -> None:
+        pipeline = [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}]
+        token = None
+        failures = 0
+        while True:
+            try:
+                async with col("presence").watch(
+                    pipeline, full_document="updateLookup", resume_after=token
+                ) as stream:
+                    self._streaming = True
+                    failures = 0
+                    if token is None:
+                        # Changes before the stream opened are only in Mongo
+                        await self.refresh()
+                    async for change in stream:
+                        doc = change.get("fullDocument") or {}
+                        if doc.get("courseCode") and doc.get("lastActiveAt") is not None:
+                            self.touch(doc["userId"], doc["courseCode"], doc["lastActiveAt"])
+                            self.stream_events += 1
+                        token = stream.resume_token
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                if e.code in NOT_REPLICA_SET:
+                    logger.warning("Presence change stream needs a replica set; refreshing periodically instead")
+                    return
+                if e.code in HISTORY_LOST:
+                    token = None
+                failures += 1
+                logger.warning(f"Presence change stream failed: {e}")
+            except Exception as e:
+                failures += 1
+                logger.warning(f"Presence change stream failed: {e}")
+            finally:
+                self._streaming = False
+            backoff = min(self.retry_max_s, self.retry_min_s * 2 ** max(0, failures - 1))
+            await asyncio.sleep(backoff)
+            self.stream_restarts += 1
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_s)
+            if self._streaming:
+                continue
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Presence refresh error")
+
+    def start(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.change_stream and self._stream_task is None:
+            self._stream_task = loop.create_task(self._watch())
+        if self.refresh_s > 0 and self._refresh_task is None:
+            self._refresh_task = loop.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        for task in (self._stream_task, self._refresh_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._stream_task = self._refresh_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "courses": len(self._courses),
+            "maxCourses": self.max_courses,
+            "users": sum(len(m) for m in self._courses.values()),
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "changeStream": self._streaming,
+            "streamEvents": self.stream_events,
+            "streamRestarts": self.stream_restarts,
+        }
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _latest(a: Any, b: datetime) -> datetime:
+    if isinstance(a, datetime):
+        # Mongo returns naive UTC datetimes; compare on the same footing.
+        a, b = _utc(a), _utc(b)
+        return a if a > b else b
+    return b
+
+
+presence_buffer = PresenceBuffer()
+presence_index = PresenceIndex(presence_buffer)
@@ -0,0 +1,95 @@
+"""In-process cache of normalized ranking features per user."""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .config import PROFILE_CACHE_MAX_ENTRIES
+from .matching import ProfileFeatures, SkillVocab, _candidate_id, normalize_profile
+
+
+class ProfileCache:
+    """
+    LRU of ProfileFeatures keyed by (courseCode, userId).
+
+    An entry is valid while its rev matches the user document's profileRev,
+    which POST /profile bumps, so every worker notices edits on its next read
+    without any cross-process invalidation. Skill bits are ids in the course's
+    SkillVocab, which is why entries are scoped per course.
+
+    A course's vocabulary is kept while the course has entries and dropped
+    with its last one, so memory stays bounded by max_entries. Features
+    normalized with a dropped vocabulary carry it along; in_vocab()
+    re-expresses them in the current one.
+    """
+
+    def __init__(self, max_entries: int = PROFILE_CACHE_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[Tuple[str, str], ProfileFeatures]" = OrderedDict()
+        self._vocabs: Dict[str, SkillVocab] = {}
+        self._counts: Dict[str, int] = {}  # entries per course
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.vocab_evictions = 0
+
+    def vocab(self, course_code: str) -> SkillVocab:
+        """The course's vocabulary; a fresh, unstored one if it has no entries."""
+        v = self._vocabs.get(course_code)
+        return v if v is not None else SkillVocab()
+
+    def peek(self, course_code: str, user_id: str, rev: int) -> Optional[ProfileFeatures]:
+        """Cached features if still at rev, without normalizing on a miss."""
+        f = self._entries.get((course_code, user_id))
+        if f is None or f.rev != rev:
+            return None
+        self._entries.move_to_end((course_code, user_id))
+        self.hits += 1
+        return f
+
+    def get(self, course_code: str, doc: Dict[str, Any]) -> ProfileFeatures:
+        """Features for a user document, normalizing it only on a miss."""
+        key = (course_code, _candidate_id(doc) or "")
+        f = self.peek(course_code, key[1], int(doc.get("profileRev") or 0))
+        if f is not None:
+            return f
+
+        self.misses += 1
+        v = self._vocabs.get(course_code)
+        if v is None:
+            v = self._vocabs[course_code] = SkillVocab()
+        f = normalize_profile(doc, v)
+        if key not in self._entries:
+            self._counts[course_code] = self._counts.get(course_code, 0) + 1
+        self._entries[key] = f
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            (code, _), _ = self._entries.popitem(last=False)
+            self.evictions += 1
+            self._release(code)
+        return f
+
+    def _release(self, course_code: str) -> None:
+        n = self._counts[course_code] - 1
+        if n:
+            self._counts[course_code] = n
+        else:
+            del self._counts[course_code]
+            del self._vocabs[course_code]
+            self.vocab_evictions += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "maxEntries": self.max_entries,
+            "courses": len(self._vocabs),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "vocabEvictions": self.vocab_evictions,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+profile_cache = ProfileCache()
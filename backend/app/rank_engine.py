@@ -0,0 +1,733 @@
+"""
+Vectorized ranking engine.
+
+Scores a whole course's candidates at once with NumPy instead of looping over
+them in Python. The candidate set is encoded into arrays once (roles, skills,
+availability, last activity) and every component of the ranking — role,
+skills, availability, activity and the diversity penalty — is computed as an
+array operation.
+
+Scores and ordering are identical to matching.rank_candidates, which stays the
+reference implementation:
+- backend/app/main.py -> /recommendations calls rank_candidates_batch(...)
+
+Ranking is two steps so feeds (feeds.py) can keep the first: score_batch()
+computes one viewer's unweighted component scores (role, skills,
+availability, diversity) as an (n, 4) matrix, and rank_scored() weighs them
+for a mode, adds activity as of now, orders and builds reasons. The matrix
+doesn't depend on the mode, so switching modes is only a weighted sum.
+
+A mode is a weight profile compiled once into a ScoringKernel (weight
+vector + reason thresholds); see weights.py for the registry.
+"""
+
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .matching import (
+    ALL_ROLES,
+    DEFAULT_PROFILE,
+    REASON_THRESHOLDS,
+    WEIGHT_PROFILES,
+    AVAIL_BLOCK_MINUTES,
+    AVAIL_CONTINUES,
+    AVAIL_DAY_BITS,
+    AVAIL_DAYS,
+    ProfileFeatures,
+    Ranked,
+    SkillVocab,
+    _candidate_id,
+    _debug_print_top5,
+    _extract_pod_state,
+    _extract_swiped_ids,
+    _missing_roles,
+    _norm_availability,
+    _norm_roles,
+    _norm_skills,
+    _parse_dt,
+    _pick_top_reasons,
+    _role_score_and_reason,
+    _skills_meta,
+    normalize_profile,
+)
+
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_US_TICK = timedelta(microseconds=1)
+_US_PER_HOUR = 3600 * 1_000_000
+
+_WORD_BITS = 64
+_WORD_MASK = (1 << _WORD_BITS) - 1
+
+# (max age in hours, score, reason); unknown activity is handled separately.
+_ACTIVITY_BUCKETS = [
+    (24, 1.0, "active within 24h"),
+    (72, 0.7, "active within 3d"),
+    (168, 0.45, "active within 7d"),
+]
+_ACTIVITY_STALE = (0.2, "inactive recently")
+_ACTIVITY_UNKNOWN = (0.3, "activity unknown")
+
+
+@dataclass
+class CandidateBatch:
+    """A course's candidates encoded as arrays (row i == candidate i)."""
+
+    user_ids: List[str]
+    uid_order: np.ndarray        # rank of each userId in ascending string order
+    primary: np.ndarray          # index into ALL_ROLES, -1 when no role
+    role_hits: np.ndarray        # (n, len(ALL_ROLES)) bool
+    skill_vocab: SkillVocab
+    skill_words: np.ndarray      # (n, words) uint64, skill bitmasks split into 64-bit words
+    skill_count: np.ndarray
+    avail_mask: np.ndarray       # uint64 availability bitmask (see matching.AVAIL_*)
+    avail_minutes: np.ndarray
+    last_active_us: np.ndarray   # microseconds since epoch, 0 when unknown
+    has_last_active: np.ndarray
+
+    # Normalized values kept for reason strings
+    roles: List[List[str]]
+    skill_masks: List[int]
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def available_at(self, slots: Sequence[str]) -> np.ndarray:
+        """Bool mask of candidates free in every slot, e.g. ["Tue evening"].
+        Selects no one when there are no slots or any of them doesn't parse."""
+        bits = [_norm_availability([slot]) for slot in slots]
+        if not bits or not all(bits):
+            return np.zeros(len(self), dtype=bool)
+        want = _norm_availability(slots)
+        return (self.avail_mask & np.uint64(want)) == want
+
+
+def encode_candidates(
+    candidates: List[Dict[str, Any]],
+    now: Optional[datetime] = None,
+    vocab: Optional[SkillVocab] = None,
+) -> CandidateBatch:
+    """Normalize and encode candidate documents into a CandidateBatch."""
+    now = now or datetime.now(timezone.utc)
+    vocab = vocab if vocab is not None else SkillVocab()
+
+    profiles: List[ProfileFeatures] = []
+    last_active: List[Optional[datetime]] = []
+
+    for c in candidates:
+        if _candidate_id(c) is None:
+            continue
+        profiles.append(normalize_profile(c, vocab))
+        last_active.append(
+            c.get("lastActiveAt") or (c.get("presence") or {}).get("lastActiveAt")
+        )
+
+    return encode_profiles(profiles, last_active, vocab, now=now)
+
+
+def encode_profiles(
+    profiles: List[ProfileFeatures],
+    last_active: Sequence[Any],
+    vocab: SkillVocab,
+    now: Optional[datetime] = None,
+) -> CandidateBatch:
+    """Encode already-normalized profiles (e.g. from the profile cache)."""
+    now = now or datetime.now(timezone.utc)
+
+    user_ids = [p.userId for p in profiles]
+    roles = [p.roles for p in profiles]
+    skill_masks = [p.skills for p in profiles]
+    avail = [p.availability for p in profiles]
+
+    n = len(user_ids)
+
+    primary = np.full(n, -1, dtype=np.int8)
+    role_hits = np.zeros((n, len(ALL_ROLES)), dtype=bool)
+    for i, rs in enumerate(roles):
+        if rs:
+            primary[i] = ALL_ROLES.index(rs[0])
+            for r in rs:
+                role_hits[i, ALL_ROLES.index(r)] = True
+
+    words = _word_count(vocab)
+    skill_words = np.array([_pack(m, words) for m in skill_masks], dtype=np.uint64).reshape(n, words)
+
+    avail_mask = np.array(avail, dtype=np.uint64)
+
+    last_active_us, has_last_active = _encode_last_active(last_active, now)
+
+    return CandidateBatch(
+        user_ids=user_ids,
+        uid_order=_uid_order(user_ids),
+        primary=primary,
+        role_hits=role_hits,
+        skill_vocab=vocab,
+        skill_words=skill_words,
+        skill_count=np.array([m.bit_count() for m in skill_masks], dtype=np.int64),
+        avail_mask=avail_mask,
+        avail_minutes=_mask_minutes(avail_mask),
+        last_active_us=last_active_us,
+        has_last_active=has_last_active,
+        roles=roles,
+        skill_masks=skill_masks,
+    )
+
+
+def encode_last_active(last_active: Sequence[Any], now: Optional[datetime] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Activity columns (last_active_us, has_last_active) for set_last_active's
+    input, without touching a batch; safe to run in a thread."""
+    return _encode_last_active(last_active, now or datetime.now(timezone.utc))
+
+
+def set_last_active(batch: CandidateBatch, last_active: Sequence[Any], now: Optional[datetime] = None) -> None:
+    """Replace the batch's activity column (row i == last_active[i]) in place."""
+    batch.last_active_us, batch.has_last_active = encode_last_active(last_active, now)
+
+
+def update_batch(batch: CandidateBatch, row_of: Dict[str, int], profiles: List[ProfileFeatures]) -> List[int]:
+    """
+    Write profiles into the batch in place: rows with the same userId are
+    replaced, new users are appended (row_of is updated). Returns their rows.
+    Profiles from another vocabulary are re-expressed in batch.skill_vocab.
+    """
+    profiles = [p.in_vocab(batch.skill_vocab) for p in profiles]
+    sub = encode_profiles(profiles, [None] * len(profiles), batch.skill_vocab)
+    words = max(batch.skill_words.shape[1], sub.skill_words.shape[1])
+    # The vocabulary only grows, so widening is zero-padding the high words.
+    batch.skill_words = _widen(batch.skill_words, words)
+    sub.skill_words = _widen(sub.skill_words, words)
+
+    rows = []
+    new = []
+    for j, uid in enumerate(sub.user_ids):
+        i = row_of.get(uid)
+        if i is None:
+            new.append(j)
+            continue
+        rows.append(i)
+        batch.primary[i] = sub.primary[j]
+        batch.role_hits[i] = sub.role_hits[j]
+        batch.skill_words[i] = sub.skill_words[j]
+        batch.skill_count[i] = sub.skill_count[j]
+        batch.avail_mask[i] = sub.avail_mask[j]
+        batch.avail_minutes[i] = sub.avail_minutes[j]
+        batch.roles[i] = sub.roles[j]
+        batch.skill_masks[i] = sub.skill_masks[j]
+
+    if new:
+        n = len(batch)
+        for k, j in enumerate(new):
+            row_of[sub.user_ids[j]] = n + k
+            rows.append(n + k)
+            batch.user_ids.append(sub.user_ids[j])
+            batch.roles.append(sub.roles[j])
+            batch.skill_masks.append(sub.skill_masks[j])
+        for name in ("primary", "role_hits", "skill_words", "skill_count", "avail_mask",
+                     "avail_minutes", "last_active_us", "has_last_active"):
+            setattr(batch, name, np.concatenate([getattr(batch, name), getattr(sub, name)[new]]))
+        batch.uid_order = _uid_order(batch.user_ids)
+    return rows
+
+
+# Columns of ScoredBatch.components, named as in the weights dicts
+COMPONENTS = ("role", "skills", "availability", "diversity_penalty")
+_ROLE, _SKILLS, _AVAIL, _PENALTY = range(len(COMPONENTS))
+
+
+@dataclass(frozen=True)
+class ScoringKernel:
+    """A weight profile compiled for ranking: everything order_scored and
+    explain_rows need, so a request never looks weights up by name."""
+
+    name: str
+    weights: np.ndarray          # per COMPONENTS column
+    activity: float
+    thresholds: Dict[str, float]  # reason thresholds (see matching.REASON_THRESHOLDS)
+
+
+def compile_profile(
+    name: str, weights: Dict[str, float], thresholds: Optional[Dict[str, float]] = None
+) -> ScoringKernel:
+    """Compile a weights dict (keys as matching.WEIGHTS) into a kernel."""
+    return ScoringKernel(
+        name=name,
+        weights=np.array([float(weights[c]) for c in COMPONENTS]),
+        activity=float(weights["activity"]),
+        thresholds={**REASON_THRESHOLDS, **(thresholds or {})},
+    )
+
+
+BUILTIN_KERNELS = {name: compile_profile(name, w) for name, w in WEIGHT_PROFILES.items()}
+
+
+def _kernel(mode: Union[str, ScoringKernel]) -> ScoringKernel:
+    if isinstance(mode, ScoringKernel):
+        return mode
+    return BUILTIN_KERNELS.get(mode, BUILTIN_KERNELS[DEFAULT_PROFILE])
+
+
+@dataclass
+class ScoredBatch:
+    """
+    One viewer's unweighted component scores over a CandidateBatch. Activity
+    depends on the clock and is added by rank_scored(); weights are applied
+    there too, so one ScoredBatch serves every mode.
+    """
+
+    batch: CandidateBatch
+    me_primary: str
+    me_skills: int
+    me_skill_count: int
+    me_avail: int
+    missing_roles: List[str]
+    in_pod: bool
+    components: np.ndarray       # (n, len(COMPONENTS)) float64
+    overlap_blocks: List[int]
+
+
+def score_batch(
+    me: Union[Dict[str, Any], ProfileFeatures],
+    batch: CandidateBatch,
+    my_pod_roles_or_state: Union[List[str], Dict[str, Any], None],
+) -> ScoredBatch:
+    """Component scores of every candidate in the batch for one viewer."""
+    if isinstance(me, ProfileFeatures):
+        me_primary = me.primary
+        me_skills = me.skills
+        me_skill_count = me.skills.bit_count()
+        me_avail = me.availability
+    else:
+        me_roles = _norm_roles(me.get("rolePrefs", []))
+        me_primary = me_roles[0] if me_roles else ""
+        me_skill_tokens = _norm_skills(me.get("skills", []))
+        # Tokens outside the course vocabulary can't be shared; they only grow the union.
+        me_skills = batch.skill_vocab.mask(me_skill_tokens, add=False)
+        me_skill_count = len(me_skill_tokens)
+        me_avail = _norm_availability(me.get("availability", []))
+
+    pod_roles, member_count = _extract_pod_state(my_pod_roles_or_state)
+
+    scored = ScoredBatch(
+        batch=batch,
+        me_primary=me_primary,
+        me_skills=me_skills,
+        me_skill_count=me_skill_count,
+        me_avail=me_avail,
+        missing_roles=_missing_roles(pod_roles, member_count),
+        in_pod=bool(pod_roles),
+        components=np.zeros((0, len(COMPONENTS))),
+        overlap_blocks=[],
+    )
+    scored.components, scored.overlap_blocks = _components(scored, batch)
+    return scored
+
+
+def rescore_rows(scored: ScoredBatch, rows: Sequence[int]) -> None:
+    """Recompute the points of some rows after update_batch() changed them."""
+    n = len(scored.batch)
+    if len(scored.components) < n:
+        grow = n - len(scored.components)
+        scored.components = np.concatenate([scored.components, np.zeros((grow, len(COMPONENTS)))])
+        scored.overlap_blocks.extend([0] * grow)
+    if not rows:
+        return
+
+    idx = np.asarray(rows, dtype=np.int64)
+    components, blocks = _components(scored, _take(scored.batch, idx))
+    scored.components[idx] = components
+    for i, b in zip(rows, blocks):
+        scored.overlap_blocks[i] = b
+
+
+@dataclass
+class RankOrder:
+    """A ranking of a ScoredBatch at one instant; arrays are per batch row."""
+
+    rows: np.ndarray             # ranked rows, best first
+    scores: np.ndarray           # rounded totals
+    activity_pts: np.ndarray
+    activity_bucket: np.ndarray
+    kernel: ScoringKernel
+
+
+def order_scored(
+    scored: ScoredBatch,
+    mode: Union[str, ScoringKernel] = DEFAULT_PROFILE,
+    prior_swipes: Optional[Sequence[Any]] = None,
+    exclude: Optional[np.ndarray] = None,
+    top_k: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> RankOrder:
+    """
+    Weigh the components for a mode (a built-in profile name or a compiled
+    kernel), add activity as of now and order the rows (score desc, then
+    userId asc). exclude is an optional bool mask of rows to leave out (e.g.
+    a feed's swiped candidates).
+    """
+    batch = scored.batch
+    kernel = _kernel(mode)
+    now = now or datetime.now(timezone.utc)
+    order, scores, activity_pts, activity_bucket = _order_arrays(
+        scored.components,
+        batch.last_active_us,
+        batch.has_last_active,
+        batch.uid_order,
+        keep_mask(batch, prior_swipes, exclude),
+        kernel,
+        _to_us(now),
+        top_k,
+    )
+    return RankOrder(
+        rows=order, scores=scores, activity_pts=activity_pts, activity_bucket=activity_bucket, kernel=kernel
+    )
+
+
+def keep_mask(
+    batch: CandidateBatch, prior_swipes: Optional[Sequence[Any]] = None, exclude: Optional[np.ndarray] = None
+) -> np.ndarray:
+    """Bool mask of the rows order_scored() may return."""
+    keep = np.ones(len(batch), dtype=bool) if exclude is None else ~exclude
+    swiped_ids = _extract_swiped_ids(prior_swipes)
+    if swiped_ids:
+        keep &= np.array([uid not in swiped_ids for uid in batch.user_ids], dtype=bool)
+    return keep
+
+
+def _order_arrays(
+    components: np.ndarray,
+    last_active_us: np.ndarray,
+    has_last_active: np.ndarray,
+    uid_order: np.ndarray,
+    keep: np.ndarray,
+    kernel: ScoringKernel,
+    now_us: int,
+    top_k: Optional[int] = None,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    The array work of order_scored(), over any slice of rows (rank_pool runs
+    it per shard): returns (ordered rows, scores, activity points, activity
+    buckets), rows relative to the slice.
+    """
+    activity_s, activity_bucket = _activity_scores(last_active_us, has_last_active, now_us)
+    activity_pts = kernel.activity * activity_s
+
+    pts = components * kernel.weights
+    total = pts[:, _ROLE] + pts[:, _SKILLS] + pts[:, _AVAIL] + activity_pts - pts[:, _PENALTY]
+
+    # Python's round() (not np.round) so scores match the reference exactly.
+    scores = np.array([round(t, 2) for t in total.tolist()], dtype=np.float64)
+
+    idx = np.flatnonzero(keep)
+    if top_k is not None:
+        top_k = max(0, top_k)
+        idx = _top_k(idx, scores, top_k)
+    # Deterministic order (score desc, then userId asc)
+    order = idx[np.lexsort((uid_order[idx], -scores[idx]))]
+    if top_k is not None:
+        order = order[:top_k]
+    return order, scores, activity_pts, activity_bucket
+
+
+def explain_rows(
+    scored: ScoredBatch, ranking: RankOrder, rows: Sequence[int], debug: bool = False
+) -> List[Dict[str, Any]]:
+    """Result dicts (score, reasons, breakdown) for some rows of a ranking."""
+    batch = scored.batch
+    thresholds = ranking.kernel.thresholds
+    ranked: List[Ranked] = []
+    for i in rows:
+        _, role_reason = _role_score_and_reason(
+            me_primary=scored.me_primary,
+            cand_roles=batch.roles[i],
+            missing_roles=scored.missing_roles,
+            in_pod=scored.in_pod,
+        )
+        activity_reason = _activity_reason(ranking.activity_bucket[i])
+        role_i, skills_i, avail_i, penalty_i = (scored.components[i] * ranking.kernel.weights).tolist()
+        activity_i = float(ranking.activity_pts[i])
+
+        # Meta is only read by _pick_top_reasons above these thresholds.
+        skills_meta = (
+            _skills_meta(batch.skill_vocab, scored.me_skills, batch.skill_masks[i])
+            if skills_i > thresholds["skills"]
+            else {}
+        )
+        avail_meta = {"overlapBlocks": scored.overlap_blocks[i]}
+
+        ranked.append(
+            Ranked(
+                userId=batch.user_ids[i],
+                score=float(ranking.scores[i]),
+                reasons=_pick_top_reasons(
+                    role_reason=role_reason,
+                    role_pts=role_i,
+                    skills_meta=skills_meta,
+                    skills_pts=skills_i,
+                    avail_meta=avail_meta,
+                    avail_pts=avail_i,
+                    activity_reason=activity_reason,
+                    activity_pts=activity_i,
+                    thresholds=thresholds,
+                ),
+                breakdown={
+                    "role": round(role_i, 2),
+                    "skills": round(skills_i, 2),
+                    "availability": round(avail_i, 2),
+                    "activity": round(activity_i, 2),
+                    "diversityPenalty": round(-penalty_i, 2),
+                },
+            )
+        )
+
+    if debug:
+        _debug_print_top5(ranked)
+
+    return [
+        {"userId": r.userId, "row": row, "score": r.score, "reasons": r.reasons, "breakdown": r.breakdown}
+        for row, r in zip(rows, ranked)
+    ]
+
+
+def rank_scored(
+    scored: ScoredBatch,
+    mode: Union[str, ScoringKernel] = DEFAULT_PROFILE,
+    prior_swipes: Optional[Sequence[Any]] = None,
+    exclude: Optional[np.ndarray] = None,
+    debug: bool = False,
+    top_k: Optional[int] = None,
+    now: Optional[datetime] = None,
+) -> List[Dict[str, Any]]:
+    """order_scored + explain_rows; output is the same as rank_candidates_batch."""
+    ranking = order_scored(scored, mode, prior_swipes=prior_swipes, exclude=exclude, top_k=top_k, now=now)
+    return explain_rows(scored, ranking, ranking.rows.tolist(), debug=debug)
+
+
+def rank_candidates_batch(
+    me: Union[Dict[str, Any], ProfileFeatures],
+    candidates: Union[List[Dict[str, Any]], CandidateBatch],
+    my_pod_roles_or_state: Union[List[str], Dict[str, Any], None],
+    prior_swipes: Optional[Sequence[Any]] = None,
+    debug: bool = False,
+    mode: str = "skillmatch",
+    top_k: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Drop-in replacement for matching.rank_candidates. Each result also
+    carries "row", its index in the batch (== position in the list passed to
+    encode_profiles), so callers can join back to their documents in O(1).
+
+    candidates may be raw documents or a CandidateBatch from
+    encode_candidates()/encode_profiles(), so one encoded course can be ranked
+    for many viewers. me may be a ProfileFeatures normalized with the batch's
+    skill vocabulary.
+
+    top_k selects the best K with argpartition; reasons and breakdowns are
+    only built for those.
+    """
+    now = datetime.now(timezone.utc)
+    batch = candidates if isinstance(candidates, CandidateBatch) else encode_candidates(candidates, now=now)
+    scored = score_batch(me, batch, my_pod_roles_or_state)
+    return rank_scored(scored, mode, prior_swipes=prior_swipes, debug=debug, top_k=top_k, now=now)
+
+
+def _components(scored: ScoredBatch, batch: CandidateBatch) -> Tuple[np.ndarray, List[int]]:
+    """COMPONENTS matrix and overlap blocks of a batch for scored's viewer."""
+    role_s = _role_scores(batch, scored.me_primary, scored.missing_roles, scored.in_pod)
+    skills_s, skill_sim = _skills_scores(batch, scored.me_skills, scored.me_skill_count)
+    avail_s, overlap_blocks = _availability_scores(batch, scored.me_avail)
+    diversity_pen = _diversity_penalties(batch, scored.me_primary, skill_sim)
+    return np.column_stack([role_s, skills_s, avail_s, diversity_pen]).astype(np.float64), overlap_blocks
+
+
+def _top_k(idx: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+    """Rows that can appear in the best k: everything scoring at least the
+    k-th best score, so ties at the cut are still broken by userId."""
+    if k >= len(idx):
+        return idx
+    if k == 0:
+        return idx[:0]
+    neg = -scores[idx]
+    kth = np.partition(neg, k - 1)[k - 1]
+    return idx[neg <= kth]
+
+
+
+# Component scores (arrays, mirror the scalar helpers in matching.py)
+
+
+def _role_scores(batch: CandidateBatch, me_primary: str, missing_roles: List[str], in_pod: bool) -> np.ndarray:
+    n = len(batch)
+    me_idx = ALL_ROLES.index(me_primary) if me_primary else -1
+
+    if in_pod and missing_roles:
+        missing_idx = [ALL_ROLES.index(r) for r in missing_roles]
+        fills = batch.role_hits[:, missing_idx].any(axis=1)
+        if me_idx >= 0:
+            fallback = np.where(batch.primary != me_idx, 0.55, 0.25)
+        else:
+            fallback = np.full(n, 0.25)
+        s = np.where(fills, 1.0, fallback)
+    elif me_idx >= 0:
+        s = np.where(batch.primary == me_idx, 0.25, 0.85)
+    else:
+        s = np.full(n, 0.55)
+
+    return np.where(batch.primary >= 0, s, 0.2)
+
+
+def _skills_scores(batch: CandidateBatch, me_skills: int, me_count: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (skills score, Jaccard similarity with 1.0 for two empty sets)."""
+    n = len(batch)
+    vocab = batch.skill_vocab
+    words = batch.skill_words.shape[1]
+    cand = batch.skill_words
+    me_words = np.array(_pack(me_skills, words), dtype=np.uint64)
+
+    inter = np.bitwise_count(cand & me_words).sum(axis=1, dtype=np.int64)
+    union = batch.skill_count + me_count - inter
+    jacc = np.divide(inter, union, out=np.zeros(n), where=union > 0)
+
+    # Same counting as SkillVocab.synergy_count, one synergy skill of mine at a time.
+    hits = np.zeros(n, dtype=np.int64)
+    twice = np.zeros(n, dtype=np.int64)
+    m = me_skills & vocab.synergy_bits
+    while m:
+        low = m & -m
+        bit = low.bit_length() - 1
+        adj = np.array(_pack(vocab.synergy[bit], words), dtype=np.uint64)
+        hits += np.bitwise_count(cand & adj).sum(axis=1, dtype=np.int64)
+        has_bit = (cand[:, bit // _WORD_BITS] >> np.uint64(bit % _WORD_BITS)) & np.uint64(1)
+        twice += has_bit.astype(np.int64) * np.bitwise_count(cand & adj & me_words).sum(axis=1, dtype=np.int64)
+        m ^= low
+    hits -= twice // 2
+
+    overlap_component = 0.25 * jacc
+    complement_component = 0.65 * np.minimum(1.0, hits / 2.0)
+    score = np.minimum(1.0, overlap_component + complement_component)
+
+    sim = np.divide(inter, union, out=np.ones(n), where=union > 0)
+    return score, sim
+
+
+def _availability_scores(batch: CandidateBatch, me_avail: int) -> Tuple[np.ndarray, List[int]]:
+    """Returns (availability score, overlapping block count) via AND + popcount."""
+    n = len(batch)
+    if not me_avail:
+        return np.zeros(n), [0] * n
+
+    both = batch.avail_mask & np.uint64(me_avail)
+    overlap = _mask_minutes(both)
+    me_minutes = int(_mask_minutes(np.array([me_avail], dtype=np.uint64))[0])
+
+    denom = np.maximum(1, np.minimum(me_minutes, batch.avail_minutes))
+    ratio = np.clip(overlap / denom, 0.0, 1.0)
+    ratio = np.where(batch.avail_minutes > 0, ratio, 0.0)
+
+    continued = (both << np.uint64(AVAIL_DAYS)) & np.uint64(AVAIL_CONTINUES)
+    blocks = np.bitwise_count(both & ~continued)
+    return ratio, blocks.tolist()
+
+
+def _activity_scores(
+    last_active_us: np.ndarray, has_last_active: np.ndarray, now_us: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Returns (activity score, bucket index into _activity_reason)."""
+    age_us = now_us - last_active_us
+
+    bucket = np.full(len(last_active_us), len(_ACTIVITY_BUCKETS), dtype=np.int8)
+    for k in range(len(_ACTIVITY_BUCKETS) - 1, -1, -1):
+        bucket[age_us <= _ACTIVITY_BUCKETS[k][0] * _US_PER_HOUR] = k
+    bucket[~has_last_active] = -1
+
+    table = np.array([b[1] for b in _ACTIVITY_BUCKETS] + [_ACTIVITY_STALE[0], _ACTIVITY_UNKNOWN[0]])
+    return table[bucket], bucket
+
+
+def _activity_reason(bucket: int) -> str:
+    if bucket < 0:
+        return _ACTIVITY_UNKNOWN[1]
+    if bucket >= len(_ACTIVITY_BUCKETS):
+        return _ACTIVITY_STALE[1]
+    return _ACTIVITY_BUCKETS[bucket][2]
+
+
+def _diversity_penalties(batch: CandidateBatch, me_primary: str, skill_sim: np.ndarray) -> np.ndarray:
+    if not me_primary:
+        return np.zeros(len(batch))
+    same_role = batch.primary == ALL_ROLES.index(me_primary)
+    pen = np.minimum(1.0, (skill_sim - 0.8) / 0.2)
+    return np.where(same_role & (skill_sim >= 0.8), pen, 0.0)
+
+
+
+# Encoding helpers
+
+
+def _take(batch: CandidateBatch, idx: np.ndarray) -> CandidateBatch:
+    """The given rows as their own batch (for scoring a few rows)."""
+    rows = idx.tolist()
+    return CandidateBatch(
+        user_ids=[batch.user_ids[i] for i in rows],
+        uid_order=batch.uid_order[idx],
+        primary=batch.primary[idx],
+        role_hits=batch.role_hits[idx],
+        skill_vocab=batch.skill_vocab,
+        skill_words=batch.skill_words[idx],
+        skill_count=batch.skill_count[idx],
+        avail_mask=batch.avail_mask[idx],
+        avail_minutes=batch.avail_minutes[idx],
+        last_active_us=batch.last_active_us[idx],
+        has_last_active=batch.has_last_active[idx],
+        roles=[batch.roles[i] for i in rows],
+        skill_masks=[batch.skill_masks[i] for i in rows],
+    )
+
+
+def _widen(skill_words: np.ndarray, words: int) -> np.ndarray:
+    extra = words - skill_words.shape[1]
+    return np.pad(skill_words, ((0, 0), (0, extra))) if extra > 0 else skill_words
+
+
+def _encode_last_active(last_active: Sequence[Any], now: datetime) -> Tuple[np.ndarray, np.ndarray]:
+    n = len(last_active)
+    last_active_us = np.zeros(n, dtype=np.int64)
+    has_last_active = np.zeros(n, dtype=bool)
+    for i, v in enumerate(last_active):
+        dt = _parse_dt(v, now=now)
+        if dt is not None:
+            last_active_us[i] = _to_us(dt)
+            has_last_active[i] = True
+    return last_active_us, has_last_active
+
+
+def _uid_order(user_ids: List[str]) -> np.ndarray:
+    """Rank of each userId in ascending string order (the tie-break)."""
+    n = len(user_ids)
+    uid_order = np.empty(n, dtype=np.int64)
+    uid_order[sorted(range(n), key=user_ids.__getitem__)] = np.arange(n)
+    return uid_order
+
+
+def _word_count(vocab: SkillVocab) -> int:
+    return max(1, -(-len(vocab) // _WORD_BITS))
+
+
+def _pack(mask: int, words: int) -> List[int]:
+    return [(mask >> (w * _WORD_BITS)) & _WORD_MASK for w in range(words)]
+
+
+def _mask_minutes(masks: np.ndarray) -> np.ndarray:
+    total = np.zeros(masks.shape, dtype=np.int64)
+    for b, minutes in enumerate(AVAIL_BLOCK_MINUTES):
+        day_bits = (masks >> np.uint64(b * AVAIL_DAYS)) & np.uint64(AVAIL_DAY_BITS)
+        total += minutes * np.bitwise_count(day_bits).astype(np.int64)
+    return total
+
+
+def _to_us(dt: datetime) -> int:
+    return (dt - _EPOCH) // _US_TICK
@@ -0,0 +1,224 @@
+"""
+Process-pool ranking for large courses.
+
+Ordering a feed (weights, activity, Python round() per row, sort) is
+CPU-bound and runs on the event loop, so a 20k-candidate ranking stalls
+every other request in the worker. At RANK_POOL_MIN_CANDIDATES and above,
+rank_pool.order() runs it in RANK_POOL_WORKERS processes instead:
+
+- the inputs (component matrix, last activity, userId order, keep mask) are
+  copied once into a shared-memory block, and per-row outputs (scores,
+  activity) are written back into the same block, so nothing per candidate
+  is pickled
+- rows are split into one contiguous shard per worker; each orders its shard
+  (top_k only, when given) and the parent merges the shard orders
+
+Results are identical to rank_engine.order_scored(), which smaller courses
+keep calling in-process. Processes are started on the first large ranking,
+so workers that never see one don't pay for them. If the pool breaks, the
+call falls back to in-process ranking and the pool is restarted on the next
+large one.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from .config import RANK_POOL_MIN_CANDIDATES, RANK_POOL_WORKERS
+from .rank_engine import (
+    RankOrder,
+    ScoredBatch,
+    ScoringKernel,
+    _kernel,
+    _order_arrays,
+    _to_us,
+    keep_mask,
+    order_scored,
+)
+
+logger = logging.getLogger(__name__)
+
+# (shared memory name, [(array name, dtype, shape, byte offset)])
+Layout = Tuple[str, List[Tuple[str, str, Tuple[int, ...], int]]]
+
+
+class RankPool:
+    def __init__(self, workers: int = RANK_POOL_WORKERS, min_candidates: int = RANK_POOL_MIN_CANDIDATES):
+        self.workers = max(0, workers)
+        self.min_candidates = min_candidates
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self.pooled = 0
+        self.inline = 0
+        self.failures = 0
+
+    def use_pool(self, n: int) -> bool:
+        return self.workers > 0 and n >= self.min_candidates
+
+    async def order(
+        self,
+        scored: ScoredBatch,
+        mode: Union[str, ScoringKernel],
+        prior_swipes: Optional[Sequence[Any]] = None,
+        exclude: Optional[np.ndarray] = None,
+        top_k: Optional[int] = None,
+        now: Optional[datetime] = None,
+    ) -> RankOrder:
+        """order_scored(), sharded across the pool for large batches."""
+        if not self.use_pool(len(scored.batch)):
+            self.inline += 1
+            return order_scored(scored, mode, prior_swipes=prior_swipes, exclude=exclude, top_k=top_k, now=now)
+
+        kernel = _kernel(mode)
+        now = now or datetime.now(timezone.utc)
+        keep = keep_mask(scored.batch, prior_swipes, exclude)
+        try:
+            ranking = await self._order_sharded(scored, kernel, keep, top_k, now)
+        except (BrokenProcessPool, OSError) as e:
+            logger.warning(f"Rank pool failed ({e}); ranking in-process")
+            self.failures += 1
+            self._reset()
+            return order_scored(scored, kernel, prior_swipes=prior_swipes, exclude=exclude, top_k=top_k, now=now)
+        self.pooled += 1
+        return ranking
+
+    async def _order_sharded(
+        self,
+        scored: ScoredBatch,
+        kernel: ScoringKernel,
+        keep: np.ndarray,
+        top_k: Optional[int],
+        now: datetime,
+    ) -> RankOrder:
+        batch = scored.batch
+        n = len(batch)
+        shm, arrays, layout = _share(
+            {
+                "components": scored.components[:n],
+                "last_active_us": batch.last_active_us,
+                "has_last_active": batch.has_last_active,
+                "uid_order": batch.uid_order,
+                "keep": keep,
+            },
+            {
+                "scores": ((n,), np.float64),
+                "activity_pts": ((n,), np.float64),
+                "activity_bucket": ((n,), np.int8),
+            },
+        )
+        try:
+            loop = asyncio.get_running_loop()
+            executor = self._pool()
+            bounds = np.linspace(0, n, min(self.workers, n) + 1).astype(int)
+            parts = await asyncio.gather(*[
+                loop.run_in_executor(executor, _order_shard, layout, int(lo), int(hi), kernel, _to_us(now), top_k)
+                for lo, hi in zip(bounds[:-1], bounds[1:])
+                if hi > lo
+            ])
+            scores = arrays["scores"].copy()
+            activity_pts = arrays["activity_pts"].copy()
+            activity_bucket = arrays["activity_bucket"].copy()
+        finally:
+            del arrays
+            shm.close()
+            shm.unlink()
+
+        # Shard orders are already best-first; merge them by the same key.
+        rows = np.concatenate(parts) if parts else np.zeros(0, dtype=np.int64)
+        rows = rows[np.lexsort((batch.uid_order[rows], -scores[rows]))]
+        if top_k is not None:
+            rows = rows[: max(0, top_k)]
+        return RankOrder(
+            rows=rows, scores=scores, activity_pts=activity_pts, activity_bucket=activity_bucket, kernel=kernel
+        )
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: don't fork a process holding the event loop and Mongo client
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _reset(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stop(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "minCandidates": self.min_candidates,
+            "running": self._executor is not None,
+            "pooled": self.pooled,
+            "inline": self.inline,
+            "failures": self.failures,
+        }
+
+
+def _share(
+    inputs: Dict[str, np.ndarray], outputs: Dict[str, Tuple[Tuple[int, ...], Any]]
+) -> Tuple[SharedMemory, Dict[str, np.ndarray], Layout]:
+    """One shared-memory block holding copies of inputs and room for outputs."""
+    specs = [(k, a.dtype, a.shape) for k, a in inputs.items()]
+    specs += [(k, np.dtype(dt), shape) for k, (shape, dt) in outputs.items()]
+    fields = []
+    offset = 0
+    for name, dt, shape in specs:
+        fields.append((name, dt.str, tuple(shape), offset))
+        size = int(np.prod(shape, dtype=np.int64)) * dt.itemsize
+        offset += -(-size // 8) * 8
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    arrays = _views(shm, fields)
+    for k, a in inputs.items():
+        arrays[k][...] = a
+    return shm, arrays, (shm.name, fields)
+
+
+def _views(shm: SharedMemory, fields) -> Dict[str, np.ndarray]:
+    return {
+        name: np.ndarray(shape, dtype=np.dtype(dt), buffer=shm.buf, offset=offset)
+        for name, dt, shape, offset in fields
+    }
+
+
+def _order_shard(
+    layout: Layout, lo: int, hi: int, kernel: ScoringKernel, now_us: int, top_k: Optional[int]
+) -> np.ndarray:
+    """Worker: order rows [lo, hi) and write their scores; returns batch rows."""
+    name, fields = layout
+    shm = SharedMemory(name=name)
+    try:
+        a = _views(shm, fields)
+        order, scores, activity_pts, activity_bucket = _order_arrays(
+            a["components"][lo:hi],
+            a["last_active_us"][lo:hi],
+            a["has_last_active"][lo:hi],
+            a["uid_order"][lo:hi],
+            a["keep"][lo:hi],
+            kernel,
+            now_us,
+            top_k,
+        )
+        a["scores"][lo:hi] = scores
+        a["activity_pts"][lo:hi] = activity_pts
+        a["activity_bucket"][lo:hi] = activity_bucket
+        del a
+        return order + lo
+    finally:
+        shm.close()
+
+
+rank_pool = RankPool()
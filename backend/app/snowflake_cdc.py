@@ -0,0 +1,210 @@
+"""
+Change data capture from Mongo to Snowflake: `python -m app cdc`.
+
+Request handlers don't write to Snowflake. This process tails one change
+stream on the database, filtered to the users, swipes, pods and presence
+collections, maps each changed document to its row (snowflake_sync.py) and
+puts it in the outbox (snowflake_writer.py), which MERGEs rows in batches.
+Changes are read in batches of up to CDC_BATCH_MAX, or whatever arrived
+within CDC_BATCH_S.
+
+Updates are read with fullDocument=updateLookup, so every event carries the
+document as it is now: a replayed or reordered event never writes an older
+state over a newer one, and pod membership changes made with $addToSet are
+synced like any other update. Deletes aren't propagated.
+
+After each batch the rows are made durable (synced to the outbox's spool,
+or written to Snowflake without one) and only then is the stream's resume
+token saved in the cdc_offsets collection. A restart resumes after the last
+saved batch; changes past it are delivered again, which the MERGE absorbs.
+If the token has fallen off the oplog, rerun with --backfill to copy the
+collections in full and start tailing from now.
+
+Change streams need a replica set (docker-compose runs a single-node one).
+With SNOWFLAKE_FAKE=true the rows go to the in-memory fake and the table
+sizes are printed on exit.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from .config import CDC_BATCH_MAX, CDC_BATCH_S, SNOWFLAKE_FAKE
+from .db import HISTORY_LOST, NOT_REPLICA_SET, check_connection, col, db
+from .snowflake_db import is_snowflake_configured, snowflake_pool
+from .snowflake_sync import pod_row, presence_row, swipe_row, user_row
+from .snowflake_writer import snowflake_writer
+
+logger = logging.getLogger(__name__)
+
+# Mongo collection -> (Snowflake table, row mapper)
+SOURCES: Dict[str, Tuple[str, Callable[[Dict[str, Any]], Dict[str, Any]]]] = {
+    "users": ("users", user_row),
+    "swipes": ("swipes", swipe_row),
+    "pods": ("pods", pod_row),
+    "presence": ("presence", presence_row),
+}
+
+OFFSETS = "cdc_offsets"
+STREAM_ID = "snowflake"
+
+
+class SnowflakeCDC:
+    def __init__(self, batch_max: int = CDC_BATCH_MAX, batch_s: float = CDC_BATCH_S):
+        self.batch_max = max(1, batch_max)
+        self.batch_s = batch_s
+        self._saved: Optional[Dict[str, Any]] = None
+        self.events = 0
+        self.skipped = 0
+        self.backfilled = 0
+        self.checkpoints = 0
+        self.last_lag_s = 0.0
+
+    async def load_token(self) -> Optional[Dict[str, Any]]:
+        doc = await col(OFFSETS).find_one({"_id": STREAM_ID})
+        return doc.get("token") if doc else None
+
+    async def checkpoint(self, token: Optional[Dict[str, Any]]) -> None:
+        """Make the rows put so far durable, then save the token after them."""
+        await snowflake_writer.persist()
+        if token is None or token == self._saved:
+            return
+        await col(OFFSETS).update_one(
+            {"_id": STREAM_ID},
+            {"$set": {"token": token, "updatedAt": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        self._saved = token
+        self.checkpoints += 1
+
+    async def backfill(self) -> int:
+        """Put every document of every source collection in the outbox."""
+        n = 0
+        for name, (table, to_row) in SOURCES.items():
+            async for doc in col(name).find():
+                await snowflake_writer.put(table, to_row(doc))
+                n += 1
+                if n % self.batch_max == 0:
+                    await snowflake_writer.persist()
+            logger.info(f"Backfilled {name} ({n} rows so far)")
+        await snowflake_writer.persist()
+        self.backfilled += n
+        return n
+
+    async def run(self, stop: asyncio.Event, backfill: bool = False) -> None:
+        """Tail the change stream until stop is set."""
+        pipeline = [{
+            "$match": {
+                "ns.coll": {"$in": list(SOURCES)},
+                "operationType": {"$in": ["insert", "update", "replace"]},
+            }
+        }]
+        token = None if backfill else await self.load_token()
+        if token is None and not backfill:
+            logger.info("No saved resume token; tailing changes from now")
+        async with db.watch(
+            pipeline,
+            full_document="updateLookup",
+            resume_after=token,
+            max_await_time_ms=max(1, int(self.batch_s * 1000)),
+        ) as stream:
+            if backfill:
+                # The stream is open first, so nothing changed during the copy is missed
+                start = stream.resume_token
+                await self.backfill()
+                await self.checkpoint(start)
+            while not stop.is_set():
+                n = await self._batch(stream)
+                await self.checkpoint(stream.resume_token)
+                if n:
+                    logger.info(f"CDC: {n} changes synced (lag {self.last_lag_s:.1f}s)")
+
+    async def _batch(self, stream) -> int:
+        """Put up to batch_max changes, or those that arrive within batch_s."""
+        n = 0
+        deadline = time.monotonic() + self.batch_s
+        while n < self.batch_max and time.monotonic() < deadline:
+            change = await stream.try_next()
+            if change is None:
+                break
+            n += 1
+            self.events += 1
+            doc = change.get("fullDocument")
+            if doc is None:
+                # Deleted before the update was looked up
+                self.skipped += 1
+                continue
+            table, to_row = SOURCES[change["ns"]["coll"]]
+            await snowflake_writer.put(table, to_row(doc))
+            if change.get("clusterTime") is not None:
+                self.last_lag_s = max(0.0, time.time() - change["clusterTime"].time)
+        return n
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "events": self.events,
+            "skipped": self.skipped,
+            "backfilled": self.backfilled,
+            "checkpoints": self.checkpoints,
+            "lastLagS": round(self.last_lag_s, 3),
+            "writer": snowflake_writer.stats(),
+        }
+
+
+async def main(backfill: bool = False) -> int:
+    """CLI entry point; runs until SIGINT/SIGTERM."""
+    if not is_snowflake_configured():
+        print("Snowflake is not configured: set the SNOWFLAKE_* variables, or SNOWFLAKE_FAKE=true")
+        return 2
+    await check_connection()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass  # Windows: Ctrl+C still raises KeyboardInterrupt
+
+    cdc = SnowflakeCDC()
+    await snowflake_writer.start()
+    code = 0
+    try:
+        while not stop.is_set():
+            try:
+                await cdc.run(stop, backfill=backfill)
+            except OperationFailure as e:
+                if e.code in HISTORY_LOST:
+                    logger.error(f"Resume token is no longer in the oplog ({e}); rerun with --backfill")
+                    code = 1
+                    break
+                if e.code in NOT_REPLICA_SET:
+                    logger.error("Change streams need a replica set (see docker-compose.yml)")
+                    code = 1
+                    break
+                logger.warning(f"Change stream failed ({e}); resuming from the last checkpoint")
+            except PyMongoError as e:
+                logger.warning(f"Change stream failed ({e}); resuming from the last checkpoint")
+            else:
+                break
+            backfill = False
+            try:
+                await asyncio.wait_for(stop.wait(), CDC_BATCH_S * 5)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        await snowflake_writer.stop()
+        snowflake_pool.close()
+
+    s = cdc.stats()
+    print(f"{s['events']} changes, {s['backfilled']} backfilled, {s['checkpoints']} checkpoints")
+    if SNOWFLAKE_FAKE:
+        from .snowflake_fake import fake_snowflake
+        print({t: len(rows) for t, rows in fake_snowflake.tables.items()})
+    return code
@@ -1,53 +1,201 @@
-"""Snowflake database connection and utilities."""
+"""Snowflake database connection and utilities.
+
+Connections come from a small thread-safe pool (snowflake_pool). A pooled
+connection is only pinged with SELECT 1 when it has sat idle for
+SNOWFLAKE_IDLE_CHECK_S; a connection whose statement fails is closed rather
+than returned. Failed connects open a circuit breaker: until the backoff
+(SNOWFLAKE_RETRY_MIN_S, doubling up to SNOWFLAKE_RETRY_MAX_S) has passed,
+callers get SnowflakeUnavailable at once instead of another connect attempt,
+and then a single caller tries again.
+"""
 import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Tuple
+
 from .config import (
     SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER, SNOWFLAKE_PASSWORD,
-    SNOWFLAKE_WAREHOUSE, SNOWFLAKE_DATABASE, SNOWFLAKE_SCHEMA
+    SNOWFLAKE_WAREHOUSE, SNOWFLAKE_DATABASE, SNOWFLAKE_SCHEMA, SNOWFLAKE_FAKE,
+    SNOWFLAKE_POOL_SIZE, SNOWFLAKE_IDLE_CHECK_S, SNOWFLAKE_RETRY_MIN_S, SNOWFLAKE_RETRY_MAX_S,
 )
 
 logger = logging.getLogger(__name__)
 
-_snowflake_conn = None
-
-def get_snowflake_connection():
-    """Get or create Snowflake connection."""
-    global _snowflake_conn
-    
-    # Check if Snowflake is configured
-    if not all([SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER, SNOWFLAKE_PASSWORD, 
-                SNOWFLAKE_WAREHOUSE, SNOWFLAKE_DATABASE]):
-        return None
-    
-    # Return existing connection if valid
-    if _snowflake_conn is not None:
+
+class SnowflakeUnavailable(ConnectionError):
+    pass
+
+
+def is_snowflake_configured():
+    """Credentials are set (or the fake is on); doesn't connect."""
+    return SNOWFLAKE_FAKE or all([SNOWFLAKE_ACCOUNT, SNOWFLAKE_USER, SNOWFLAKE_PASSWORD,
+                                  SNOWFLAKE_WAREHOUSE, SNOWFLAKE_DATABASE])
+
+
+def _connect():
+    if SNOWFLAKE_FAKE:
+        from .snowflake_fake import fake_snowflake
+        return fake_snowflake
+    import snowflake.connector
+    # Log connection attempt (without password)
+    logger.info(f"Attempting Snowflake connection: account={SNOWFLAKE_ACCOUNT}, user={SNOWFLAKE_USER}, warehouse={SNOWFLAKE_WAREHOUSE}, database={SNOWFLAKE_DATABASE}, schema={SNOWFLAKE_SCHEMA}")
+    conn = snowflake.connector.connect(
+        account=SNOWFLAKE_ACCOUNT,
+        user=SNOWFLAKE_USER,
+        password=SNOWFLAKE_PASSWORD,
+        warehouse=SNOWFLAKE_WAREHOUSE,
+        database=SNOWFLAKE_DATABASE,
+        schema=SNOWFLAKE_SCHEMA
+    )
+    logger.info(f"Connected to Snowflake: {SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}")
+    return conn
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+class SnowflakePool:
+    def __init__(
+        self,
+        max_size: int = SNOWFLAKE_POOL_SIZE,
+        idle_check_s: float = SNOWFLAKE_IDLE_CHECK_S,
+        retry_min_s: float = SNOWFLAKE_RETRY_MIN_S,
+        retry_max_s: float = SNOWFLAKE_RETRY_MAX_S,
+    ):
+        self.max_size = max(1, max_size)
+        self.idle_check_s = idle_check_s
+        self.retry_min_s = retry_min_s
+        self.retry_max_s = max(retry_min_s, retry_max_s)
+        self._idle: List[Tuple[Any, float]] = []  # (connection, last used, monotonic)
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._lock = threading.Lock()
+        self._failures = 0                         # consecutive failed connects
+        self._retry_at = 0.0                       # breaker open until (monotonic)
+        self._probing = False
+        self._closed = False
+        self.connects = 0
+        self.connect_failures = 0
+        self.pings = 0
+        self.discarded = 0
+        self.rejected = 0
+
+    def available(self) -> bool:
+        """Configured and the breaker isn't open. Cached state; no round trip."""
+        return is_snowflake_configured() and not self._closed and time.monotonic() >= self._retry_at
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for one unit of work (blocks while all are in
+        use). Raises SnowflakeUnavailable instead of connecting while the
+        breaker is open. If the body raises, the connection is closed."""
+        if not is_snowflake_configured():
+            raise SnowflakeUnavailable("Snowflake is not configured")
+        self._slots.acquire()
+        try:
+            conn = self._acquire()
+            try:
+                yield conn
+            except BaseException:
+                self.discarded += 1
+                if not SNOWFLAKE_FAKE:
+                    _close_quietly(conn)
+                raise
+            self._release(conn)
+        finally:
+            self._slots.release()
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if self._closed:
+                    raise SnowflakeUnavailable("Snowflake pool is closed")
+                if not self._idle:
+                    break
+                conn, last_used = self._idle.pop()
+            if time.monotonic() - last_used < self.idle_check_s or self._ping(conn):
+                return conn
+            self.discarded += 1
+            _close_quietly(conn)
+        return self._open()
+
+    def _ping(self, conn) -> bool:
+        self.pings += 1
+        cursor = None
         try:
-            # Test connection
-            _snowflake_conn.cursor().execute("SELECT 1")
-            return _snowflake_conn
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            return True
         except Exception:
-            # Connection is stale, create new one
-            _snowflake_conn = None
-    
-    # Create new connection
-    try:
-        import snowflake.connector
-        # Log connection attempt (without password)
-        logger.info(f"Attempting Snowflake connection: account={SNOWFLAKE_ACCOUNT}, user={SNOWFLAKE_USER}, warehouse={SNOWFLAKE_WAREHOUSE}, database={SNOWFLAKE_DATABASE}, schema={SNOWFLAKE_SCHEMA}")
-        _snowflake_conn = snowflake.connector.connect(
-            account=SNOWFLAKE_ACCOUNT,
-            user=SNOWFLAKE_USER,
-            password=SNOWFLAKE_PASSWORD,
-            warehouse=SNOWFLAKE_WAREHOUSE,
-            database=SNOWFLAKE_DATABASE,
-            schema=SNOWFLAKE_SCHEMA
-        )
-        logger.info(f"Connected to Snowflake: {SNOWFLAKE_DATABASE}.{SNOWFLAKE_SCHEMA}")
-        return _snowflake_conn
-    except Exception as e:
-        logger.warning(f"Failed to connect to Snowflake: {e}")
-        logger.warning(f"Connection details: account={SNOWFLAKE_ACCOUNT}, user={SNOWFLAKE_USER}, warehouse={SNOWFLAKE_WAREHOUSE}, database={SNOWFLAKE_DATABASE}")
-        return None
-
-def is_snowflake_available():
-    """Check if Snowflake is configured and available."""
-    return get_snowflake_connection() is not None
+            return False
+        finally:
+            if cursor is not None:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+    def _open(self):
+        with self._lock:
+            wait = self._retry_at - time.monotonic()
+            if wait > 0 or self._probing:
+                self.rejected += 1
+                raise SnowflakeUnavailable(f"Snowflake unavailable; retrying in {max(0.0, wait):.1f}s")
+            # Half-open after a failure: one caller tries, the rest are rejected
+            self._probing = self._failures > 0
+        try:
+            conn = _connect()
+        except Exception as e:
+            with self._lock:
+                self._probing = False
+                self._failures += 1
+                backoff = min(self.retry_max_s, self.retry_min_s * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + backoff
+            self.connect_failures += 1
+            logger.warning(f"Failed to connect to Snowflake: {e} (retrying in {backoff:.1f}s)")
+            logger.warning(f"Connection details: account={SNOWFLAKE_ACCOUNT}, user={SNOWFLAKE_USER}, warehouse={SNOWFLAKE_WAREHOUSE}, database={SNOWFLAKE_DATABASE}")
+            raise SnowflakeUnavailable(str(e)) from e
+        with self._lock:
+            self._probing = False
+            self._failures = 0
+            self._retry_at = 0.0
+        self.connects += 1
+        return conn
+
+    def _release(self, conn) -> None:
+        with self._lock:
+            if not self._closed:
+                self._idle.append((conn, time.monotonic()))
+                return
+        if not SNOWFLAKE_FAKE:
+            _close_quietly(conn)
+
+    def close(self) -> None:
+        """Close idle connections; ones in use are closed when returned."""
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        if not SNOWFLAKE_FAKE:
+            for conn, _ in idle:
+                _close_quietly(conn)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "maxSize": self.max_size,
+            "idle": len(self._idle),
+            "available": self.available(),
+            "consecutiveFailures": self._failures,
+            "retryInS": round(max(0.0, self._retry_at - time.monotonic()), 1),
+            "connects": self.connects,
+            "connectFailures": self.connect_failures,
+            "pings": self.pings,
+            "discarded": self.discarded,
+            "rejected": self.rejected,
+        }
+
+
+snowflake_pool = SnowflakePool()
@@ -0,0 +1,120 @@
+"""
+In-memory stand-in for a Snowflake connection (SNOWFLAKE_FAKE=true).
+
+Understands the statements this app sends: SELECT 1 and the writer's MERGE
+(snowflake_writer.merge_sql). Tables are dicts of rows by primary key, and
+every statement is recorded, so batching, ordering and last-writer-wins
+can be checked offline:
+
+    from app.snowflake_fake import fake_snowflake
+    fake_snowflake.tables["users"][user_id]["display_name"]
+    len(fake_snowflake.statements)
+
+fail_next(n) makes the next n statements raise, to simulate an outage.
+"""
+from __future__ import annotations
+
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+_MERGE = re.compile(
+    r"MERGE INTO (?P<table>\w+) t USING \(SELECT .* FROM VALUES .*\) s "
+    r"ON t\.(?P<key>\w+) = s\.(?P=key) "
+    r"WHEN MATCHED THEN UPDATE SET (?P<updates>.*) "
+    r"WHEN NOT MATCHED THEN INSERT \((?P<columns>[^)]*)\)",
+    re.S,
+)
+
+
+class FakeSnowflakeError(Exception):
+    pass
+
+
+class FakeCursor:
+    def __init__(self, conn: "FakeSnowflake"):
+        self._conn = conn
+        self._result: List[tuple] = []
+        self.rowcount = 0
+
+    def execute(self, sql: str, params: Optional[Sequence[Any]] = None) -> "FakeCursor":
+        self._result, self.rowcount = self._conn._execute(sql.strip(), list(params or []))
+        return self
+
+    def fetchone(self) -> Optional[tuple]:
+        return self._result.pop(0) if self._result else None
+
+    def fetchall(self) -> List[tuple]:
+        rows, self._result = self._result, []
+        return rows
+
+    def close(self) -> None:
+        pass
+
+
+class FakeSnowflake:
+    def __init__(self) -> None:
+        self.tables: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.statements: List[str] = []
+        self.commits = 0
+        self.closed = False
+        self._fail = 0
+        self._lock = threading.Lock()
+
+    def cursor(self) -> FakeCursor:
+        return FakeCursor(self)
+
+    def commit(self) -> None:
+        self.commits += 1
+
+    def close(self) -> None:
+        self.closed = True
+
+    def fail_next(self, n: int = 1) -> None:
+        self._fail = n
+
+    def reset(self) -> None:
+        with self._lock:
+            self.tables.clear()
+            self.statements.clear()
+            self.commits = 0
+            self.closed = False
+            self._fail = 0
+
+    def _execute(self, sql: str, params: List[Any]):
+        with self._lock:
+            self.statements.append(sql)
+            if self._fail > 0:
+                self._fail -= 1
+                raise FakeSnowflakeError("simulated Snowflake failure")
+            if sql.upper() == "SELECT 1":
+                return [(1,)], 1
+            m = _MERGE.match(sql)
+            if m is None:
+                raise FakeSnowflakeError(f"fake Snowflake can't run: {sql[:80]}")
+            return [], self._merge(m, params)
+
+    def _merge(self, m: "re.Match[str]", params: List[Any]) -> int:
+        table = self.tables.setdefault(m["table"], {})
+        key = m["key"]
+        columns = [c.strip() for c in m["columns"].split(",")]
+        updates = [u.split("=")[0].strip() for u in m["updates"].split(",")]
+        width = len(columns)
+        if len(params) % width:
+            raise FakeSnowflakeError("parameter count doesn't match the column list")
+
+        source = [dict(zip(columns, params[i : i + width])) for i in range(0, len(params), width)]
+        keys = [row[key] for row in source]
+        if len(set(keys)) != len(keys):
+            # Snowflake rejects (or applies arbitrarily) a MERGE whose source repeats a key
+            raise FakeSnowflakeError("duplicate key in MERGE source")
+        for row in source:
+            existing = table.get(row[key])
+            if existing is None:
+                table[row[key]] = row
+            else:
+                existing.update({c: row[c] for c in updates})
+        return len(source)
+
+
+fake_snowflake = FakeSnowflake()
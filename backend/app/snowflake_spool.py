@@ -0,0 +1,213 @@
+"""
+Durable on-disk spool behind the Snowflake outbox.
+
+Every row put in the outbox is also appended to a local SQLite database in
+WAL mode (one append-only log file plus the table). Appends and acks are
+buffered in memory and written by one dedicated thread every
+SNOWFLAKE_SPOOL_SYNC_S as a single transaction, so there is one fsync per
+interval and no file I/O on the request path; a crash loses at most that
+interval. A row leaves the spool when its MERGE commits (acked by
+(table, key, seq), which also clears older writes of the same key).
+
+Unacked rows are replayed in order by the writer (snowflake_writer.py)
+after a restart, and whenever the in-memory outbox filled up and rows were
+only spooled. Compaction, every SNOWFLAKE_SPOOL_COMPACT_S, keeps only the
+newest row per key, so an outage grows the spool with distinct users,
+swipes and pods rather than with every write.
+
+Each process claims its own spool file: SNOWFLAKE_SPOOL_PATH, or
+SNOWFLAKE_SPOOL_PATH.1, .2, ... if another process holds the lock, so spools
+left by a stopped worker are picked up by the next one to start.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no claim, one process per spool path
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+MAX_SPOOL_FILES = 64
+
+
+@dataclass
+class SpoolRecord:
+    seq: int
+    table: str
+    key: str
+    row: Dict[str, Any]
+
+
+class Spool:
+    def __init__(self, path: str, sync_interval: float, compact_interval: float):
+        self.base_path = path
+        self.path = path
+        self.sync_interval = sync_interval
+        self.compact_interval = compact_interval
+        self.next_seq = 1
+        self._appends: List[Tuple[int, str, str, str]] = []
+        self._acks: List[Tuple[str, str, int]] = []
+        self._db: Optional[sqlite3.Connection] = None
+        self._lock_file = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snowflake-spool")
+        self._last_compact = time.monotonic()
+        self.rows = 0                  # on disk, as of the last sync
+        self.syncs = 0
+        self.compacted = 0
+        self.last_sync_ms = 0.0
+
+    # Loop side (no I/O)
+
+    def append(self, table: str, key: str, row: Dict[str, Any]) -> int:
+        seq = self.next_seq
+        self.next_seq += 1
+        self._appends.append((seq, table, key, json.dumps(row, separators=(",", ":"))))
+        return seq
+
+    def ack(self, table: str, key: str, seq: int) -> None:
+        self._acks.append((table, key, seq))
+
+    def pending(self) -> int:
+        return len(self._appends)
+
+    # Thread side
+
+    async def open(self) -> int:
+        """Claim and open a spool file; returns how many rows are unsent."""
+        return await self._call(self._open)
+
+    async def sync(self) -> None:
+        await self._with_buffers(self._sync)
+
+    async def read(self, after_seq: int, limit: int) -> List[SpoolRecord]:
+        """Unsent records after a seq, oldest first (pending appends included)."""
+        return await self._with_buffers(self._read, after_seq, limit)
+
+    async def maybe_compact(self) -> int:
+        if time.monotonic() - self._last_compact < self.compact_interval:
+            return 0
+        self._last_compact = time.monotonic()
+        return await self._with_buffers(self._compact)
+
+    async def close(self) -> None:
+        try:
+            await self._with_buffers(self._close)
+        finally:
+            self._executor.shutdown(wait=True)
+
+    async def _with_buffers(self, fn, *args):
+        """Run fn(appends, acks, *args) on the spool thread with the buffered
+        appends and acks, putting them back if it fails."""
+        appends, self._appends = self._appends, []
+        acks, self._acks = self._acks, []
+        try:
+            return await self._call(fn, appends, acks, *args)
+        except Exception:
+            self._appends[:0] = appends
+            self._acks[:0] = acks
+            raise
+
+    async def _call(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _open(self) -> int:
+        for i in range(MAX_SPOOL_FILES):
+            path = self.base_path if i == 0 else f"{self.base_path}.{i}"
+            if self._claim(path):
+                break
+        else:
+            raise RuntimeError(f"No free Snowflake spool file at {self.base_path}[.N]")
+        self.path = path
+        db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=FULL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS spool ("
+            "seq INTEGER PRIMARY KEY, tbl TEXT NOT NULL, key TEXT NOT NULL, row TEXT NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS spool_key ON spool (tbl, key, seq)")
+        self._db = db
+        last, self.rows = db.execute("SELECT COALESCE(MAX(seq), 0), COUNT(*) FROM spool").fetchone()
+        self.next_seq = last + 1  # open() comes before any append
+        return self.rows
+
+    def _claim(self, path: str) -> bool:
+        if fcntl is None:
+            return True
+        f = open(path + ".lock", "a+")
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            return False
+        self._lock_file = f
+        return True
+
+    def _sync(self, appends, acks) -> None:
+        if self._db is None or not (appends or acks):
+            return
+        t0 = time.perf_counter()
+        db = self._db
+        db.execute("BEGIN")
+        try:
+            added = db.executemany("INSERT INTO spool (seq, tbl, key, row) VALUES (?, ?, ?, ?)", appends).rowcount
+            removed = db.executemany("DELETE FROM spool WHERE tbl = ? AND key = ? AND seq <= ?", acks).rowcount
+            db.execute("COMMIT")
+        except Exception:
+            db.execute("ROLLBACK")
+            raise
+        self.rows += max(0, added) - max(0, removed)
+        self.syncs += 1
+        self.last_sync_ms = (time.perf_counter() - t0) * 1000.0
+
+    def _read(self, appends, acks, after_seq: int, limit: int) -> List[SpoolRecord]:
+        self._sync(appends, acks)
+        rows = self._db.execute(
+            "SELECT seq, tbl, key, row FROM spool WHERE seq > ? ORDER BY seq LIMIT ?", (after_seq, limit)
+        ).fetchall()
+        return [SpoolRecord(seq, tbl, key, json.loads(row)) for seq, tbl, key, row in rows]
+
+    def _compact(self, appends, acks) -> int:
+        self._sync(appends, acks)
+        db = self._db
+        removed = db.execute(
+            "DELETE FROM spool WHERE seq NOT IN (SELECT MAX(seq) FROM spool GROUP BY tbl, key)"
+        ).rowcount
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        if removed:
+            self.rows -= removed
+            self.compacted += removed
+            logger.info(f"Compacted Snowflake spool {self.path}: {removed} superseded rows removed")
+        return removed
+
+    def _close(self, appends, acks) -> None:
+        if self._db is not None:
+            self._sync(appends, acks)
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._db.close()
+            self._db = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "path": os.path.abspath(self.path),
+            "rows": self.rows,
+            "pendingAppends": len(self._appends),
+            "pendingAcks": len(self._acks),
+            "syncs": self.syncs,
+            "lastSyncMs": round(self.last_sync_ms, 2),
+            "compacted": self.compacted,
+        }
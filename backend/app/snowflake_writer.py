@@ -0,0 +1,484 @@
+"""
+Snowflake outbox: bounded, micro-batching writer.
+
+The change-data-capture process (snowflake_cdc.py) doesn't touch Snowflake
+itself: it puts a row in this outbox per change. A consumer per table
+writes its queue in batches as a single
+
+    MERGE INTO <table> t USING (SELECT ... FROM VALUES (...), (...)) s
+    ON t.<key> = s.<key>
+    WHEN MATCHED THEN UPDATE SET ...
+    WHEN NOT MATCHED THEN INSERT ...
+
+once SNOWFLAKE_BATCH_MAX_ROWS rows are waiting or the oldest has waited
+SNOWFLAKE_FLUSH_INTERVAL_S. One MERGE and one COMMIT per batch replace a
+SELECT + UPDATE/INSERT + COMMIT per event.
+
+Statements run on SNOWFLAKE_WORKERS dedicated threads, never asyncio's
+default to_thread pool, so a slow Snowflake can't starve other to_thread
+users; each borrows its own connection from snowflake_db.snowflake_pool.
+The outbox queues at most SNOWFLAKE_OUTBOX_MAX rows (plus the batches being
+written); when it is full, SNOWFLAKE_OUTBOX_POLICY decides:
+
+- coalesce:    (default) the queue keeps one row per key, the newest, so it
+               only fills with distinct keys; then the oldest row is dropped
+- drop-oldest: every write is queued; the oldest row is dropped
+- block:       the writer waits up to SNOWFLAKE_OUTBOX_BLOCK_S for room,
+               then its row is dropped
+
+Ordering is last-writer-wins per key: each table's batches are written one
+at a time, and a batch keeps only the newest row per key (a MERGE source
+can't hold a key twice). A failed batch goes back to the front of its
+queue, under any newer rows, and is retried after SNOWFLAKE_FLUSH_INTERVAL_S.
+On shutdown the outbox drains for up to SNOWFLAKE_DRAIN_S.
+
+With SNOWFLAKE_SPOOL_PATH set, every row is also appended to a durable
+spool (snowflake_spool.py) and acked there once its MERGE commits, so
+nothing is dropped: a full outbox spills new rows to disk only, and they
+are replayed in order as the queue empties; rows left unsent by a restart
+or crash are replayed by the next start. The full-outbox policies above
+only apply without a spool.
+
+SNOWFLAKE_FAKE=true swaps in the in-memory connector (snowflake_fake.py) to
+exercise all of this offline.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from .config import (
+    SNOWFLAKE_BATCH_MAX_ROWS,
+    SNOWFLAKE_DRAIN_S,
+    SNOWFLAKE_FLUSH_INTERVAL_S,
+    SNOWFLAKE_OUTBOX_BLOCK_S,
+    SNOWFLAKE_OUTBOX_MAX,
+    SNOWFLAKE_OUTBOX_POLICY,
+    SNOWFLAKE_SPOOL_COMPACT_S,
+    SNOWFLAKE_SPOOL_PATH,
+    SNOWFLAKE_SPOOL_SYNC_S,
+    SNOWFLAKE_WORKERS,
+)
+from .snowflake_db import is_snowflake_configured, snowflake_pool
+from .snowflake_spool import Spool, SpoolRecord
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("coalesce", "drop-oldest", "block")
+
+
+@dataclass(frozen=True)
+class Table:
+    name: str
+    key: str
+    columns: Tuple[str, ...]            # in MERGE order, key first
+    insert_only: Tuple[str, ...] = ()   # kept from the first write (e.g. created_at)
+
+    def update_columns(self) -> List[str]:
+        return [c for c in self.columns if c != self.key and c not in self.insert_only]
+
+
+TABLES: Dict[str, Table] = {
+    "users": Table(
+        "users",
+        "user_id",
+        ("user_id", "display_name", "role_prefs", "skills", "availability", "course_codes", "created_at", "updated_at"),
+        insert_only=("created_at",),
+    ),
+    "swipes": Table(
+        "swipes",
+        "swipe_id",
+        ("swipe_id", "from_user_id", "to_user_id", "course_code", "decision", "created_at"),
+    ),
+    "pods": Table(
+        "pods",
+        "pod_id",
+        ("pod_id", "course_code", "member_ids", "leader_id", "created_at"),
+        insert_only=("created_at",),
+    ),
+    "presence": Table(
+        "presence",
+        "presence_id",
+        ("presence_id", "user_id", "course_code", "last_active_at"),
+    ),
+}
+
+
+def merge_sql(table: Table, n_rows: int) -> str:
+    """MERGE of n_rows VALUES rows (pyformat placeholders) into a table."""
+    cols = table.columns
+    select = ", ".join(f"column{i + 1} AS {c}" for i, c in enumerate(cols))
+    row = "(" + ", ".join(["%s"] * len(cols)) + ")"
+    updates = ", ".join(f"{c} = s.{c}" for c in table.update_columns())
+    return (
+        f"MERGE INTO {table.name} t "
+        f"USING (SELECT {select} FROM VALUES {', '.join([row] * n_rows)}) s "
+        f"ON t.{table.key} = s.{table.key} "
+        f"WHEN MATCHED THEN UPDATE SET {updates} "
+        f"WHEN NOT MATCHED THEN INSERT ({', '.join(cols)}) VALUES ({', '.join('s.' + c for c in cols)})"
+    )
+
+
+@dataclass
+class _Entry:
+    key: str
+    row: Dict[str, Any]
+    queued_at: float               # monotonic; the first write's, when coalesced
+    seq: int = 0                   # spool sequence of the row (0 without a spool)
+
+
+class SnowflakeWriter:
+    def __init__(
+        self,
+        flush_interval: float = SNOWFLAKE_FLUSH_INTERVAL_S,
+        max_rows: int = SNOWFLAKE_BATCH_MAX_ROWS,
+        max_depth: int = SNOWFLAKE_OUTBOX_MAX,
+        policy: str = SNOWFLAKE_OUTBOX_POLICY,
+        workers: int = SNOWFLAKE_WORKERS,
+        block_s: float = SNOWFLAKE_OUTBOX_BLOCK_S,
+        drain_s: float = SNOWFLAKE_DRAIN_S,
+        spool_path: str = SNOWFLAKE_SPOOL_PATH,
+    ):
+        if policy not in POLICIES:
+            logger.warning(f"Unknown SNOWFLAKE_OUTBOX_POLICY {policy!r}; using coalesce")
+            policy = "coalesce"
+        self.flush_interval = flush_interval
+        self.max_rows = max(1, max_rows)
+        self.max_depth = max(1, max_depth)
+        self.policy = policy
+        self.workers = max(1, workers)
+        self.block_s = block_s
+        self.drain_s = drain_s
+        self.spool_path = spool_path
+        # Per table, oldest first; keyed by row key under coalesce, else by sequence
+        self._queues: Dict[str, "OrderedDict[Hashable, _Entry]"] = {t: OrderedDict() for t in TABLES}
+        self._inflight: Dict[str, List[_Entry]] = {t: [] for t in TABLES}
+        self._locks = {t: asyncio.Lock() for t in TABLES}
+        self._wake = {t: asyncio.Event() for t in TABLES}
+        self._room = asyncio.Condition()
+        self._seq = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._tasks: List[asyncio.Task] = []
+        self._draining = False
+        self._spool: Optional[Spool] = None
+        self._behind = False           # rows on disk not loaded in memory yet
+        self._loaded_seq = 0           # newest spool seq loaded in memory
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.blocked = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.written = 0
+        self.merges = 0
+        self.failed_batches = 0
+        self.last_lag_s = 0.0
+
+    async def put(self, table: str, row: Dict[str, Any]) -> None:
+        """Queue a row (all of the table's columns) for Snowflake. Returns at
+        once unless the outbox is full under the block policy."""
+        if not is_snowflake_configured():
+            return
+        key = row[TABLES[table].key]
+        queue = self._queues[table]
+        self.enqueued += 1
+        seq = self._spool.append(table, key, row) if self._spool else 0
+
+        if self._spool and (self._behind or self.depth() >= self.max_depth):
+            # On disk only; the replayer loads it, in order, once there's room.
+            # (Not even coalesced: in-memory rows must stay older than spilled ones.)
+            self._behind = True
+            self.spilled += 1
+            return
+
+        if self.policy == "coalesce" and key in queue:
+            queue[key].row = row
+            queue[key].seq = seq
+            self.coalesced += 1
+            return
+
+        if self.depth() >= self.max_depth:
+            if self.policy == "block":
+                self.blocked += 1
+                if not await self._wait_for_room():
+                    self.dropped += 1
+                    return
+            else:
+                self._drop_oldest()
+
+        self._queue(table, _Entry(key, row, time.monotonic(), seq))
+        if seq:
+            self._loaded_seq = seq
+
+    def _queue(self, table: str, entry: _Entry) -> None:
+        queue = self._queues[table]
+        if self.policy == "coalesce":
+            queue[entry.key] = entry
+        elif entry.seq:
+            queue[entry.seq] = entry
+        else:
+            self._seq += 1
+            queue[self._seq] = entry
+        if len(queue) >= self.max_rows:
+            self._wake[table].set()
+
+    def depth(self) -> int:
+        """Queued rows (the bound); batches being written aren't counted."""
+        return sum(len(q) for q in self._queues.values())
+
+    def unwritten(self) -> int:
+        return self.depth() + sum(len(b) for b in self._inflight.values())
+
+    def lag_s(self) -> float:
+        """How long the oldest unwritten row has waited."""
+        oldest = [next(iter(q.values())).queued_at for q in self._queues.values() if q]
+        oldest += [b[0].queued_at for b in self._inflight.values() if b]
+        return time.monotonic() - min(oldest) if oldest else 0.0
+
+    async def _wait_for_room(self) -> bool:
+        async with self._room:
+            try:
+                await asyncio.wait_for(
+                    self._room.wait_for(lambda: self.depth() < self.max_depth), self.block_s
+                )
+                return True
+            except asyncio.TimeoutError:
+                return False
+
+    def _drop_oldest(self) -> None:
+        tables = [t for t, q in self._queues.items() if q]
+        t = min(tables, key=lambda t: next(iter(self._queues[t].values())).queued_at)
+        self._queues[t].popitem(last=False)
+        self.dropped += 1
+
+    async def persist(self) -> None:
+        """Return once every row put so far is durable: synced to the spool,
+        or, without one, written to Snowflake (retrying every flush interval)."""
+        if self._spool:
+            await self._spool.sync()
+            while self._spool.pending():
+                await self._spool.sync()
+            return
+        while self.unwritten():
+            await self.flush()
+            if self.unwritten():
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self) -> int:
+        """Write everything queued now (e.g. from a CLI without consumers)."""
+        written = 0
+        for table in TABLES:
+            while self._queues[table]:
+                n = await self._send(table)
+                if not n:
+                    break
+                written += n
+        return written
+
+    async def _send(self, table: str) -> int:
+        """Write one batch of a table; returns rows written (0 on failure)."""
+        async with self._locks[table]:
+            queue = self._queues[table]
+            if not queue:
+                return 0
+            taken = [queue.popitem(last=False) for _ in range(min(self.max_rows, len(queue)))]
+            # Newest row per key; the MERGE source can't repeat a key
+            latest: "OrderedDict[str, _Entry]" = OrderedDict()
+            for _, entry in taken:
+                latest.pop(entry.key, None)
+                latest[entry.key] = entry
+
+            self._inflight[table] = [e for _, e in taken]
+            try:
+                rows = [e.row for e in latest.values()]
+                await asyncio.get_running_loop().run_in_executor(self._pool(), self._merge, TABLES[table], rows)
+            except Exception as e:
+                self.failed_batches += 1
+                logger.warning(f"Snowflake write of {len(taken)} {table} rows failed: {e}")
+                self._requeue(table, taken)
+                return 0
+            finally:
+                self._inflight[table] = []
+                async with self._room:
+                    self._room.notify_all()
+
+            self.written += len(latest)
+            if self._spool:
+                for e in latest.values():
+                    self._spool.ack(table, e.key, e.seq)
+            self.last_lag_s = time.monotonic() - min(e.queued_at for e in latest.values())
+            return len(taken)
+
+    def _requeue(self, table: str, taken: List[Tuple[Hashable, _Entry]]) -> None:
+        """Failed batch back in front; under coalesce a newer queued row wins."""
+        queue = self._queues[table]
+        merged: "OrderedDict[Hashable, _Entry]" = OrderedDict(
+            (k, e) for k, e in taken if not (self.policy == "coalesce" and k in queue)
+        )
+        merged.update(queue)
+        queue.clear()
+        queue.update(merged)
+
+    def _merge(self, table: Table, rows: List[Dict[str, Any]]) -> None:
+        with snowflake_pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                params = [row.get(c) for row in rows for c in table.columns]
+                cursor.execute(merge_sql(table, len(rows)), params)
+                conn.commit()
+                self.merges += 1
+                logger.info(f"Merged {len(rows)} rows into Snowflake {table.name} (rows affected: {cursor.rowcount})")
+            finally:
+                cursor.close()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="snowflake")
+        return self._executor
+
+    async def _consume(self, table: str) -> None:
+        queue_wait = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wake[table].wait(), queue_wait)
+            except asyncio.TimeoutError:
+                pass
+            self._wake[table].clear()
+            queue_wait = self.flush_interval
+            try:
+                queue = self._queues[table]
+                while queue and (
+                    self._draining
+                    or len(queue) >= self.max_rows
+                    or time.monotonic() - next(iter(queue.values())).queued_at >= self.flush_interval
+                ):
+                    if not await self._send(table):
+                        break  # failed; back off for a flush interval
+                if queue and not self._draining:
+                    # Wake when the oldest row is due
+                    age = time.monotonic() - next(iter(queue.values())).queued_at
+                    queue_wait = max(0.01, self.flush_interval - age)
+            except Exception:
+                logger.exception("Snowflake outbox consumer error")
+
+    async def _replay(self) -> None:
+        """Sync the spool to disk, compact it, and load spilled rows back
+        into the queues (oldest first) once they have room."""
+        spool = self._spool
+        while True:
+            await asyncio.sleep(spool.sync_interval)
+            try:
+                await spool.sync()
+                await spool.maybe_compact()
+                while self._behind and self.depth() < self.max_depth // 2:
+                    limit = self.max_depth - self.depth()
+                    newest = spool.next_seq
+                    records = await spool.read(self._loaded_seq, limit)
+                    for r in records:
+                        self._load(r)
+                    self.replayed += len(records)
+                    if records:
+                        self._loaded_seq = records[-1].seq
+                    if len(records) < limit and spool.next_seq == newest:
+                        self._behind = False
+            except Exception:
+                logger.exception("Snowflake spool error")
+
+    def _load(self, record: SpoolRecord) -> None:
+        if record.table not in TABLES:
+            return
+        entry = self._queues[record.table].get(record.key) if self.policy == "coalesce" else None
+        if entry is not None:
+            if record.seq > entry.seq:
+                entry.row, entry.seq = record.row, record.seq
+            return
+        self._queue(record.table, _Entry(record.key, record.row, time.monotonic(), record.seq))
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        if self.spool_path and is_snowflake_configured():
+            spool = Spool(self.spool_path, SNOWFLAKE_SPOOL_SYNC_S, SNOWFLAKE_SPOOL_COMPACT_S)
+            try:
+                unsent = await spool.open()
+            except Exception as e:
+                logger.warning(f"Snowflake spool unavailable ({e}); the outbox is memory-only")
+            else:
+                self._spool = spool
+                if unsent:
+                    logger.info(f"Replaying {unsent} unsent Snowflake rows from {spool.path}")
+                    self._behind = True
+                    self._loaded_seq = 0
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._consume(t)) for t in TABLES]
+        if self._spool:
+            self._tasks.append(loop.create_task(self._replay()))
+
+    async def stop(self) -> None:
+        """Drain for up to drain_s, then stop the consumers and threads."""
+        self._draining = True
+        deadline = time.monotonic() + self.drain_s
+        try:
+            while (self.unwritten() or self._behind) and time.monotonic() < deadline:
+                if not self._tasks:
+                    if not await self.flush():
+                        break
+                    continue
+                for ev in self._wake.values():
+                    ev.set()
+                await asyncio.sleep(0.05)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            for task in self._tasks:
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+            self._tasks = []
+            if self._spool:
+                try:
+                    await self._spool.close()
+                except Exception:
+                    logger.exception("Snowflake spool close failed")
+                if self.unwritten() or self._behind:
+                    logger.info(f"Snowflake outbox stopped; unwritten rows stay in {self._spool.path}")
+                self._spool = None
+                self._behind = False
+            elif self.unwritten():
+                logger.warning(f"Snowflake outbox stopped with {self.unwritten()} rows unwritten")
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+            self._draining = False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": {t: len(q) for t, q in self._queues.items()},
+            "inflight": sum(len(b) for b in self._inflight.values()),
+            "maxDepth": self.max_depth,
+            "policy": self.policy,
+            "workers": self.workers,
+            "lagS": round(self.lag_s(), 3),
+            "lastBatchLagS": round(self.last_lag_s, 3),
+            "enqueued": self.enqueued,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "blocked": self.blocked,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "written": self.written,
+            "merges": self.merges,
+            "failedBatches": self.failed_batches,
+            "flushIntervalS": self.flush_interval,
+            "maxRows": self.max_rows,
+            "spool": {**self._spool.stats(), "behind": self._behind} if self._spool else None,
+        }
+
+
+snowflake_writer = SnowflakeWriter()
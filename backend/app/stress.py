@@ -0,0 +1,97 @@
+"""
+Concurrent pod-formation stress run against a live MongoDB.
+
+    python -m app stress [users] [rounds]
+
+Creates a throwaway course, then fires every swipe of `rounds` random
+pairings at /swipe's handler at once (both directions of each pair, so
+most land as mutual accepts racing each other). Afterwards it checks the
+pod invariants and removes everything it created. Exit code 1 on any
+violation.
+
+Point MONGO_URI at a local mongod and build the indexes first
+(python -m app indexes); the unique pods index is what keeps users from
+landing in two pods.
+"""
+from __future__ import annotations
+
+import asyncio
+import random
+from collections import Counter
+from datetime import datetime, timezone
+from typing import List
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from .db import col
+from .main import POD_MAX_MEMBERS, swipe
+from .models import SwipeIn
+
+
+async def _swipe(uid: ObjectId, target: ObjectId, course_code: str, errors: Counter) -> None:
+    body = SwipeIn(courseCode=course_code, targetUserId=str(target), decision="accept")
+    try:
+        await swipe(body, x_user_id=str(uid))
+    except HTTPException as e:
+        errors[f"{e.status_code} {e.detail}"] += 1
+
+
+async def check_pods(course_code: str) -> List[str]:
+    """Invariant violations for a course's pods (empty when healthy)."""
+    problems = []
+    seen: Counter = Counter()
+    async for p in col("pods").find({"courseCode": course_code}, {"memberIds": 1}):
+        members = p["memberIds"]
+        if len(members) > POD_MAX_MEMBERS:
+            problems.append(f"pod {p['_id']} has {len(members)} members")
+        if len(set(members)) != len(members):
+            problems.append(f"pod {p['_id']} lists a member twice")
+        seen.update(set(members))
+    problems += [f"user {uid} is in {n} pods" for uid, n in seen.items() if n > 1]
+    return problems
+
+
+async def run(n_users: int = 200, rounds: int = 3, seed: int = 0) -> int:
+    rng = random.Random(seed)
+    course_code = f"STRESS-{ObjectId()}"
+    users = col("users")
+    now = datetime.now(timezone.utc)
+    ids = [ObjectId() for _ in range(n_users)]
+    await users.insert_many([
+        {"_id": uid, "displayName": f"Stress{i}", "courseCodes": [course_code], "createdAt": now}
+        for i, uid in enumerate(ids)
+    ])
+
+    try:
+        errors: Counter = Counter()
+        tasks = []
+        for _ in range(rounds):
+            order = ids[:]
+            rng.shuffle(order)
+            for a, b in zip(order[::2], order[1::2]):
+                tasks.append(_swipe(a, b, course_code, errors))
+                tasks.append(_swipe(b, a, course_code, errors))
+        rng.shuffle(tasks)
+
+        t0 = asyncio.get_running_loop().time()
+        await asyncio.gather(*tasks)
+        elapsed = asyncio.get_running_loop().time() - t0
+
+        problems = await check_pods(course_code)
+        sizes = Counter()
+        async for p in col("pods").find({"courseCode": course_code}, {"memberIds": 1}):
+            sizes[len(p["memberIds"])] += 1
+
+        print(f"{len(tasks)} concurrent swipes over {n_users} users in {elapsed:.2f}s")
+        print(f"pods by size: {dict(sorted(sizes.items()))}")
+        for msg, n in errors.most_common():
+            print(f"  {n:>5}  {msg}")
+        for p in problems:
+            print(f"VIOLATION  {p}")
+        print("ok" if not problems else f"{len(problems)} violations")
+        return 1 if problems else 0
+    finally:
+        await col("swipes").delete_many({"courseCode": course_code})
+        await col("pods").delete_many({"courseCode": course_code})
+        await users.delete_many({"courseCodes": course_code})
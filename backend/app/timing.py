@@ -0,0 +1,43 @@
+"""Per-stage request timing, reported as a Server-Timing header."""
+from __future__ import annotations
+
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, Iterator, TypeVar
+
+T = TypeVar("T")
+
+
+class StageTimer:
+    """
+    Wall time per named stage of one request. Stages may overlap (they run
+    under asyncio.gather), so the slowest concurrent stage is the critical
+    path, and "total" is the time since the timer was created.
+    """
+
+    def __init__(self) -> None:
+        self._t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    async def run(self, name: str, aw: Awaitable[T]) -> T:
+        start = time.perf_counter()
+        try:
+            return await aw
+        finally:
+            self.stages[name] = (time.perf_counter() - start) * 1000.0
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = (time.perf_counter() - start) * 1000.0
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000.0
+
+    def header(self) -> str:
+        parts = [f"{name};dur={ms:.1f}" for name, ms in self.stages.items()]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
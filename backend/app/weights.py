@@ -0,0 +1,117 @@
+"""
+Weight profile registry (ranking modes).
+
+A profile is a named weights dict with the keys of matching.WEIGHTS (missing
+keys take those defaults) and optional "reasonThresholds". Each profile is
+compiled into a rank_engine.ScoringKernel once, when it is loaded, so a
+request only looks a kernel up by name. Sources, later ones overriding
+earlier ones with the same name:
+
+1. built-ins (matching.WEIGHT_PROFILES): skillmatch, quickmatch
+2. the WEIGHT_PROFILES env var, JSON {"name": {"role": 40, ...}, ...}
+3. a course document's "weightProfiles" field, same shape, for that course
+
+Course profiles are re-read at most every WEIGHT_PROFILES_TTL_S per course.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import math
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .config import WEIGHT_PROFILES, WEIGHT_PROFILES_TTL_S
+from .db import col
+from .matching import REASON_THRESHOLDS, WEIGHTS
+from .rank_engine import BUILTIN_KERNELS, ScoringKernel, compile_profile
+
+logger = logging.getLogger(__name__)
+
+
+def compile_profiles(specs: Any, source: str) -> Dict[str, ScoringKernel]:
+    """Compile {name: spec}; invalid profiles are logged and skipped."""
+    if not isinstance(specs, dict):
+        if specs:
+            logger.warning(f"Ignoring weight profiles from {source}: expected an object")
+        return {}
+
+    kernels: Dict[str, ScoringKernel] = {}
+    for name, spec in specs.items():
+        try:
+            weights, thresholds = _parse_profile(spec)
+        except ValueError as e:
+            logger.warning(f"Ignoring weight profile {name!r} from {source}: {e}")
+            continue
+        kernels[str(name)] = compile_profile(str(name), weights, thresholds)
+    return kernels
+
+
+def _parse_profile(spec: Any) -> Tuple[Dict[str, float], Dict[str, float]]:
+    if not isinstance(spec, dict):
+        raise ValueError("expected an object of weights")
+    unknown = set(spec) - set(WEIGHTS) - {"reasonThresholds"}
+    if unknown:
+        raise ValueError(f"unknown keys {sorted(unknown)}")
+
+    weights = {k: _number(spec.get(k, default), k) for k, default in WEIGHTS.items()}
+
+    raw = spec.get("reasonThresholds") or {}
+    if not isinstance(raw, dict) or set(raw) - set(REASON_THRESHOLDS):
+        raise ValueError(f"reasonThresholds takes {sorted(REASON_THRESHOLDS)}")
+    thresholds = {k: _number(v, f"reasonThresholds.{k}") for k, v in raw.items()}
+    return weights, thresholds
+
+
+def _number(v: Any, key: str) -> float:
+    if isinstance(v, bool) or not isinstance(v, (int, float)) or not math.isfinite(v) or v < 0:
+        raise ValueError(f"{key} must be a non-negative number")
+    return float(v)
+
+
+def _load_config(raw: str) -> Dict[str, ScoringKernel]:
+    if not raw.strip():
+        return {}
+    try:
+        specs = json.loads(raw)
+    except ValueError as e:
+        logger.warning(f"Ignoring WEIGHT_PROFILES: invalid JSON ({e})")
+        return {}
+    return compile_profiles(specs, "WEIGHT_PROFILES")
+
+
+class WeightRegistry:
+    def __init__(self, config_json: str = WEIGHT_PROFILES, ttl_s: float = WEIGHT_PROFILES_TTL_S):
+        self.ttl_s = ttl_s
+        self._global: Dict[str, ScoringKernel] = {**BUILTIN_KERNELS, **_load_config(config_json)}
+        # courseCode -> (loaded at, global + course profiles)
+        self._courses: Dict[str, Tuple[float, Dict[str, ScoringKernel]]] = {}
+
+    async def profiles(self, course_code: str) -> Dict[str, ScoringKernel]:
+        cached = self._courses.get(course_code)
+        if cached is not None and time.monotonic() - cached[0] < self.ttl_s:
+            return cached[1]
+
+        kernels = self._global
+        try:
+            course = await col("courses").find_one({"courseCode": course_code}, {"weightProfiles": 1})
+        except Exception as e:
+            logger.warning(f"Could not load weight profiles for {course_code}: {e}")
+            course = None
+        if course and course.get("weightProfiles"):
+            kernels = {**self._global, **compile_profiles(course["weightProfiles"], f"course {course_code}")}
+
+        self._courses[course_code] = (time.monotonic(), kernels)
+        return kernels
+
+    async def kernel(self, course_code: str, name: str) -> Optional[ScoringKernel]:
+        return (await self.profiles(course_code)).get(name)
+
+    def invalidate(self, course_code: Optional[str] = None) -> None:
+        if course_code is None:
+            self._courses.clear()
+        else:
+            self._courses.pop(course_code, None)
+
+
+weight_registry = WeightRegistry()
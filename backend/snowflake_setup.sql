@@ -32,6 +32,14 @@ CREATE TABLE IF NOT EXISTS pods (
     created_at TIMESTAMP_NTZ
 );
 
+-- Presence table (last heartbeat per user and course)
+CREATE TABLE IF NOT EXISTS presence (
+    presence_id VARCHAR PRIMARY KEY,  -- <user_id>_<course_code>
+    user_id VARCHAR,
+    course_code VARCHAR,
+    last_active_at TIMESTAMP_NTZ
+);
+
 -- Optional: Create indexes for better query performance
 CREATE INDEX IF NOT EXISTS idx_swipes_from_user ON swipes(from_user_id);
 CREATE INDEX IF NOT EXISTS idx_swipes_to_user ON swipes(to_user_id);
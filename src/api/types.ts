@@ -52,6 +52,7 @@ export type RecommendationUser = {
 
 export type RecommendationsResponse = {
   candidates: RecommendationUser[];
+  nextCursor?: string | null;
 };
 
 export type PodMember = {
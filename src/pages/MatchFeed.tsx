@@ -78,7 +78,7 @@ export default function MatchFeed() {
     setLoading(true);
     try {
       const rec = await api<RecommendationsResponse>(
-        `/recommendations${qs({ courseCode, mode: matchMode })}`,
+        `/recommendations${qs({ courseCode, mode: matchMode, limit: "20" })}`,
         "GET"
       );
       const list = rec?.candidates || [];